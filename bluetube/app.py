@@ -18,10 +18,15 @@
 '''
 
 import argparse
+import datetime
+import os
+import time
 
 from bluetube import Bluetube, __version__
 from bluetube.model import OutputFormatType
 
+SQL_EXTENSIONS = ('.sql', '.sqlite3', '.sqlite', '.db')
+
 
 def main():
 
@@ -31,6 +36,33 @@ def main():
                               OutputFormatType.from_char(args.type),
                               profiles)
 
+    def import_opml(bluetube, args):
+        profiles = args.profiles if args.profiles else ['default']
+        bluetube.import_playlists(args.file,
+                                  OutputFormatType.from_char(args.type),
+                                  profiles)
+
+    def export(bluetube, args):
+        if os.path.splitext(args.file)[1] in SQL_EXTENSIONS:
+            bluetube.export_db(args.file)
+        else:
+            bluetube.export_playlists(args.file)
+
+    def query(bluetube, args):
+        stale_since = time.mktime(args.stale_since.timetuple()) \
+            if args.stale_since else None
+        bluetube.query_playlists(out_type=args.output,
+                                 author=args.author,
+                                 title=args.title,
+                                 profile=args.profile,
+                                 out_format=OutputFormatType
+                                 .from_char(args.type),
+                                 stale_since=stale_since,
+                                 has_failures=args.failed)
+
+    def daemon(bluetube, args):
+        bluetube.run_daemon(args.interval * 60, args.full)
+
     description = 'The script downloads youtube video as video or audio, ' \
                   'converts and sends to a destination.'
     epilog = 'If no option specified the script shows feeds to choose, ' \
@@ -61,6 +93,39 @@ def main():
                                         help='list all playlists')
     parser_list.set_defaults(func=lambda bt, _: bt.list_playlists())
 
+    parser_query = subparsers.add_parser('query',
+                                         help='print playlists that match '
+                                              'all given filters, '
+                                              'a playlist per line')
+    parser_query.add_argument('--author', '-a',
+                              type=str,
+                              help='an author of playlists')
+    parser_query.add_argument('--title', '-T',
+                              type=str,
+                              help='a pattern of titles, '
+                                   'use * and ? as wildcards')
+    parser_query.add_argument('--profile', '-p',
+                              type=str,
+                              help='a profile of playlists')
+    parser_query.add_argument('-t', dest='type',
+                              choices=['a', 'v'],
+                              help='a type of files of playlists; '
+                                   '(a)udio or (v)ideo')
+    parser_query.add_argument('--stale-since', '-s',
+                              type=datetime.date.fromisoformat,
+                              metavar='YYYY-MM-DD',
+                              help='playlists not updated since the date')
+    parser_query.add_argument('--failed', '-f',
+                              action='store_const',
+                              const=True,
+                              help='playlists with failed videos')
+    parser_query.add_argument('--output', '-o',
+                              choices=['jsonl', 'tsv'],
+                              default='jsonl',
+                              help='JSON Lines (default) '
+                                   'or tab-separated values')
+    parser_query.set_defaults(func=query)
+
     parser_remove = subparsers.add_parser('remove',
                                           help='remove a playlist by names '
                                                'of the author and '
@@ -110,6 +175,64 @@ def main():
                                               args.reset_failed,
                                               args.days_back))
 
+    parser_import = subparsers.add_parser('import',
+                                          help='add all playlists '
+                                               'from an OPML file')
+    parser_import.add_argument('file', type=str,
+                               help='an OPML file e.g. exported by Youtube')
+    parser_import.add_argument('-t', dest='type',
+                               choices=['a', 'v'],
+                               default='v',
+                               help='a type of a file you want to get; '
+                                    '(a)udio or (v)ideo')
+    parser_import.add_argument('-p', nargs='*',
+                               dest='profiles',
+                               help='one or multiple profiles')
+    parser_import.set_defaults(func=import_opml)
+
+    parser_export = subparsers.add_parser('export',
+                                          help='save all playlists '
+                                               'to an OPML file, '
+                                               'or the whole DB to SQL '
+                                               'or an SQLite3 database')
+    parser_export.add_argument('file', type=str,
+                               help='an OPML file; *.sql for SQL, '
+                                    '*.sqlite3, *.sqlite or *.db '
+                                    'for a database')
+    parser_export.set_defaults(func=export)
+
+    parser_backup = subparsers.add_parser('backup',
+                                          help='save all playlists with '
+                                               'their state to a JSON '
+                                               'Lines file')
+    parser_backup.add_argument('file', type=str,
+                               help='a file, it is compressed '
+                                    'if the name ends with .gz')
+    parser_backup.set_defaults(func=lambda bt, args:
+                               bt.backup_db(args.file))
+
+    parser_restore = subparsers.add_parser('restore',
+                                           help='add playlists from a file '
+                                                'made by backup, replace '
+                                                'playlists with the same '
+                                                'names')
+    parser_restore.add_argument('file', type=str,
+                                help='a file made by backup')
+    parser_restore.set_defaults(func=lambda bt, args:
+                                bt.restore_db(args.file))
+
+    parser_daemon = subparsers.add_parser('daemon',
+                                          help='process feeds periodically '
+                                               'without questions, keep '
+                                               'running between updates')
+    parser_daemon.add_argument('--interval', '-i',
+                               type=int,
+                               default=15,
+                               metavar='MINUTES',
+                               help='update feeds every N minutes; '
+                                    'default: 15')
+    parser_daemon.set_defaults(func=daemon)
+
     me_group = parser.add_mutually_exclusive_group()
 
     me_group.add_argument('--send', '-s',
@@ -123,6 +246,21 @@ def main():
     parser.add_argument('--yes', '-y',
                         action='store_true',
                         help='answer positive to all questions')
+    parser.add_argument('--full',
+                        action='store_true',
+                        help='fetch all feeds, even those that are not '
+                        'expected to have updates or failed recently; '
+                        'the daemon does this on the first update only')
+    parser.add_argument('--offline',
+                        action='store_true',
+                        help='take feeds from the cache of previous runs '
+                        'instead of fetching them; the playlists are '
+                        'not updated, so the same videos are offered again')
+    parser.add_argument('--max-feed-age',
+                        type=int,
+                        metavar='MINUTES',
+                        help='take feeds fetched less than N minutes ago '
+                        'from the cache')
     parser.add_argument('--home',
                         default=Bluetube.HOME_DIR,
                         help='specify Bluetube\'s home directory. '
@@ -137,9 +275,11 @@ def main():
                         version=f'%(prog)s {__version__}')
 
     args = parser.parse_args()
+    # nobody answers questions of the daemon
+    yes = args.yes or getattr(args, 'func', None) is daemon
     bluetube = Bluetube(home_dir=args.home,
                         verbose=args.verbose,
-                        yes=args.yes)
+                        yes=yes)
     if hasattr(args, 'func'):
         args.func(bluetube, args)
     else:
@@ -150,7 +290,11 @@ def main():
         elif args.online_help:
             bluetube.open_more_help()
         else:
-            bluetube.run()
+            max_feed_age = args.max_feed_age * 60 \
+                if args.max_feed_age is not None else None
+            bluetube.run(full=args.full,
+                         offline=args.offline,
+                         max_feed_age=max_feed_age)
 
 
 if __name__ == '__main__':
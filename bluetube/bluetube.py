@@ -17,16 +17,22 @@
 
 
 import asyncio
-import copy
 import datetime
+import gzip
+import itertools
+import json
 import logging
 import os
+import random
 import re
 import shutil
 import signal
+import sys
 import tempfile
 import time
+from concurrent.futures import ProcessPoolExecutor
 from typing import NoReturn
+from xml.etree import ElementTree
 
 import aiohttp
 import feedparser
@@ -36,11 +42,18 @@ from bluetube.cli.events import Error, Event, Info, Success, Warn
 from bluetube.cli.inputer import Inputer
 from bluetube.componentfactory import ComponentFactory
 from bluetube.configs import Configs
+from bluetube.downloadstore import DownloadStore
 from bluetube.eventpublisher import EventPublisher
+from bluetube.feedcache import FeedCache
+from bluetube.feedparsing import (init_worker, is_newest_first, parse_feed,
+                                  parse_feed_info)
 from bluetube.feeds import Feeds, SqlExporter
-from bluetube.model import OutputFormatType, Playlist
+from bluetube.model import Entity, OutputFormatType, Playlist, WorkItem
+from bluetube.opml import read_opml, write_opml
 from bluetube.profiles import Profiles, ProfilesException
-from bluetube.utils import deemojify
+from bluetube.scheduler import Scheduler
+from bluetube.seenindex import SeenIndex
+from bluetube.utils import deemojify, get_files_stamp
 
 
 class Bluetube(EventPublisher):
@@ -49,6 +62,10 @@ class Bluetube(EventPublisher):
     CONFIG_FILE_NAME = 'bluetube.cfg'
     HOME_DIR = os.path.expanduser(os.path.join('~', '.bluetube'))
     ACCESS_MODE = 0o744
+    # directories of runs in the home directory
+    RUNS_DIRNAME = 'runs'
+    FETCH_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError)
+    FEED_URL = 'youtube.com/feeds/videos.xml?'
 
     def signal_handler(self, signum, _) -> NoReturn:
         '''Ctrl+c handler to quit the tool'''
@@ -68,6 +85,15 @@ class Bluetube(EventPublisher):
         self.inputer = self.factory.get_inputer(yes)
         self.temp_dir = None
         self.bt_dir = self._get_bt_dir(home_dir)
+        # objects loaded from files, reloaded if the files change
+        self._loaded = {}
+        # keep the event loop, HTTP session and workers between runs
+        self._keep_warm = False
+        self._runner = None
+        self._session = None
+        self._session_options = None
+        self._pool = None
+        self._errors_left = 0
 
         self.subscribe(self.factory.get_outputer())
 
@@ -98,6 +124,8 @@ class Bluetube(EventPublisher):
                     out_type = OutputFormatType.to_char(c.output_format)
                     profiles = ', '.join(c.profiles)
                     o = f"{' ' * 10}{c.title} |{out_type}, {profiles}|"
+                    if c.failed_count:
+                        o = f'{o} [{c.failed_count} failed]'
                     t = time.strftime('%Y-%m-%d %H:%M:%S',
                                       time.localtime(c.last_update))
                     o = f'{o} ({t})'
@@ -105,6 +133,23 @@ class Bluetube(EventPublisher):
         else:
             self.notify(Info('empty database'))
 
+    def query_playlists(self, out=None, out_type='jsonl', **filters):
+        '''write playlists that match the filters (see Feeds.query)
+        line by line as JSON objects or tab-separated values'''
+        out = out or sys.stdout
+        fields = ('author', 'title', 'url', 'out_format', 'profiles',
+                  'last_update', 'last_fetch', 'failed')
+        if out_type == 'tsv':
+            out.write('\t'.join(fields) + '\n')
+        for pl in Feeds(self.bt_dir).query(**filters):
+            if out_type == 'tsv':
+                pl['profiles'] = ','.join(pl['profiles'])
+                values = [re.sub(r'[\t\r\n]', ' ', str(pl[f]))
+                          for f in fields]
+                out.write('\t'.join(values) + '\n')
+            else:
+                out.write(json.dumps(pl, ensure_ascii=False) + '\n')
+
     def remove_playlist(self, author, title):
         ''' remove the playlist of the given author'''
         feeds = Feeds(self.bt_dir)
@@ -113,15 +158,24 @@ class Bluetube(EventPublisher):
         else:
             self.notify('playlist not found', title, author)
 
-    def run(self):
-        ''' The main method. It does everything.'''
+    def run(self, full=False, offline=False, max_feed_age=None):
+        ''' The main method. It does everything.
+        Set full to fetch feeds that are not expected to have updates.
+        Set offline to take feeds from the cache instead of the Internet
+        and keep the playlists as they are, e.g. to process them again;
+        set max_feed_age (in seconds) to take feeds from the cache
+        if they have been fetched recently.'''
 
         self._debug(f'Bluetube home directory: {self.bt_dir}.')
+        # the daemon keeps the executor, probe tools again in every run
+        self.executor.clear_cache()
 
         # self._check_media_player()
 
-        feed = Feeds(self.bt_dir)
-        pls = self._get_list(feed)
+        feed = self._load_cached('feeds',
+                                 Feeds.get_db_files(self.bt_dir),
+                                 lambda: Feeds(self.bt_dir))
+        pls = self._get_list(feed, full, offline, max_feed_age)
 
         if len(pls):
             self.notify(Success('feeds updated'))
@@ -129,44 +183,78 @@ class Bluetube(EventPublisher):
             self.notify(Info('empty database'))
             return
 
-        profiles = self._get_profiles(self.bt_dir)
-
-        self._fetch_temp_dir()
-
-        pls = self._process_playlists(pls)
+        profiles = self._load_cached('profiles',
+                                     [os.path.join(self.bt_dir,
+                                                   Profiles.PROFILES_NAME)],
+                                     lambda: self._get_profiles(self.bt_dir))
 
-        for pl in pls:
-            if not self._check_profiles(pl, profiles):
-                continue
+        self._fetch_temp_dir(isolated=True)
+        try:
+            with SeenIndex(self.bt_dir) as seen:
+                pls = self._process_playlists(pls, seen)
 
-            # combine entities (links with metadata to download) with profiles
-            pl.entities = {profile: copy.deepcopy(pl.entities)
-                           for profile in pl.profiles}
+                for pl in pls:
+                    if not self._check_profiles(pl, profiles):
+                        continue
 
-            # prepend previously failed entities
-            for pr in pl.entities:
-                if pr in pl.failed_entities:
-                    pl.entities[pr] = pl.failed_entities[pr] + pl.entities[pr]
-                    del pl.failed_entities[pr]
+                    # combine entities (links with metadata to download)
+                    # with profiles, previously failed entities go first;
+                    # the entities are shared, work items keep links to files
+                    pl.entities = {pr: [WorkItem(e)
+                                        for e in pl.pop_failed_entities(pr) +
+                                        pl.entities]
+                                   for pr in pl.profiles}
 
-            self._debug(f"process {pl}")
+                    self._debug(f"process {pl}")
 
-            self._download_list(pl, profiles)
+                    self._download_list(pl, profiles, seen)
 
-            self._convert_list(pl, profiles)
+                    self._convert_list(pl, profiles)
 
-            self._send_list(pl, profiles)
+                    self._send_list(pl, profiles)
 
-        feed.set_all_playlists(self._prepare_list(pls))
-        feed.sync()
-        self._return_temp_dir()
+            self._get_store().prune()
+            if offline:
+                # a replay, the playlists are not moved forward,
+                # so the next run offers the same videos
+                self._loaded.pop('feeds', None)
+            else:
+                feed.set_all_playlists(self._prepare_list(pls))
+                feed.sync()
+                # don't reload the DB just because of this sync
+                self._load_cached('feeds', Feeds.get_db_files(self.bt_dir),
+                                  lambda: feed, force=True)
+        finally:
+            # even a failed run leaves its files in the outbox
+            self._return_temp_dir()
+
+    def run_daemon(self, interval, full=False):
+        '''run the main method every interval seconds in this process;
+        configs, profiles, feeds, the HTTP session and the downloader
+        are kept between runs and reloaded only if their files change;
+        full is applied to the first run only'''
+        self._keep_warm = True
+        while True:
+            started = time.monotonic()
+            try:
+                self.run(full)
+            except ProfilesException as e:
+                # the user has been notified, wait for fixed profiles
+                self._debug(f'the run is skipped: {e}')
+            except Exception as e:
+                # e.g. the DB is locked or the disk is full for a while,
+                # the next run might succeed
+                self._debug('the run has failed', exc_info=True)
+                self.notify(Error('run failed', repr(e)))
+            full = False
+            time.sleep(max(0.0, interval - (time.monotonic() - started)))
 
     def send(self):
         '''send files from the bluetube download directory
         to all bluetooth devices'''
         profiles = self._get_profiles(self.bt_dir)
         self._fetch_temp_dir()
-        if os.listdir(self.temp_dir):
+        if Bluetube._list_files(self.temp_dir):
             sent = []
             nbr_divices = 0
             for profile in profiles.get_profiles():
@@ -240,6 +328,8 @@ class Bluetube(EventPublisher):
                 if days_back:
                     delta = datetime.timedelta(days=int(days_back))
                     pl.last_update -= delta.total_seconds()
+                    # make the next fetch get the whole feed again
+                    pl.reset_validators()
                 feed.sync()
                 self._debug('Done.')
         else:
@@ -252,24 +342,111 @@ class Bluetube(EventPublisher):
                 '/bluetube/blob/master/README.md']
         self.executor.open_url(''.join(link))
 
-    def export_db(self):
-        '''export DB into the bluetube.sql file for SQLite3'''
-        feed = Feeds(self.bt_dir)
-        exporter = SqlExporter(feed.get_all_playlists())
-        with open('bluetube.sql', 'w') as f:
-            exporter.export(f)
+    def export_db(self, path='bluetube.sql'):
+        '''export DB for SQLite3 into the file: SQL statements
+        if its name ends with .sql, a database otherwise'''
+        exporter = SqlExporter(Feeds(self.bt_dir))
+        if path.endswith('.sql'):
+            with open(path, 'w') as f:
+                exporter.export(f)
+        else:
+            exporter.export_db(path)
+        self.notify(Success('db exported', path))
+
+    def backup_db(self, path):
+        '''save playlists to the JSON Lines file, compressed if it is *.gz'''
+        with Bluetube._open_text(path, 'w') as f:
+            count = Feeds(self.bt_dir).backup(f)
+        self.notify(Success('backed up', count, path))
+
+    def restore_db(self, path):
+        '''add playlists from the file made by backup_db'''
+        with Bluetube._open_text(path, 'r') as f:
+            count = Feeds(self.bt_dir).restore(f)
+        self.notify(Success('restored', count, path))
+
+    @staticmethod
+    def _open_text(path, mode):
+        '''open the text file, it is compressed if its name ends with .gz'''
+        if path.endswith('.gz'):
+            return gzip.open(path, mode + 't', encoding='utf-8')
+        return open(path, mode, encoding='utf-8')
+
+    def import_playlists(self, path, out_format, profiles):
+        '''import playlists from the OPML file;
+        all feeds are validated concurrently and added at once'''
+        try:
+            with open(path, 'rb') as f:
+                urls = read_opml(f)
+        except (OSError, ElementTree.ParseError) as e:
+            self.notify(Error(e))
+            return
+        pls = []
+        for u in urls:
+            feed_url = u if Bluetube.FEED_URL in u else self._get_feed_url(u)
+            if feed_url:
+                pls.append(Playlist(None, feed_url))
+        options = self._get_configs().get_feeds_options()
+        self._errors_left = options['error_budget']
+
+        async def task(session, semaphore, executor, pl):
+            '''task that fetches and validates the feed'''
+            try:
+                response = await self._fetch_with_retries(session, semaphore,
+                                                          pl, options)
+            except Bluetube.FETCH_ERRORS as e:
+                return Error('failed to fetch', pl.url, repr(e))
+            loop = asyncio.get_running_loop()
+            info = await loop.run_in_executor(executor, parse_feed_info,
+                                              response)
+            return info if info else Error('not a feed', pl.url)
+
+        async def process_tasks(executor):
+            '''process all async tasks'''
+            semaphore = asyncio.Semaphore(options['concurrency'])
+            session = await self._get_session(options)
+            return await asyncio.gather(*[task(session, semaphore,
+                                               executor, pl)
+                                          for pl in pls])
+
+        self.notify(Info(f'Validating {len(pls)} feeds...'))
+        results = self._run_fetching(process_tasks)
+        feeds = Feeds(self.bt_dir)
+        new = {}
+        for pl, r in zip(pls, results):
+            if isinstance(r, Event):
+                self.notify(r)
+                continue
+            title = deemojify(r['title'])
+            author = deemojify(r['author'])
+            if feeds.has_playlist(author, title) or (author, title) in new:
+                self.notify(Error('playlist exists', title, author))
+            else:
+                new[(author, title)] = pl.url
+        if new:
+            feeds.add_playlists([(a, t, u) for (a, t), u in new.items()],
+                                out_format, profiles)
+        self.notify(Success('imported', len(new)))
+
+    def export_playlists(self, path):
+        '''export all playlists to the OPML file'''
+        feeds = Feeds(self.bt_dir).get_all_playlists()
+        with open(path, 'wb') as f:
+            write_opml(f, feeds)
+        nbr = sum(len(a['playlists']) for a in feeds)
+        self.notify(Success('exported', nbr, path))
 
     def _send_all_in_dir(self, sender):
         '''send all files in the given directory'''
         sent = []
-        files = os.listdir(self.temp_dir)
+        files = Bluetube._list_files(self.temp_dir)
         for fl in files:
             if fl.endswith('.part') or fl.endswith('.ytdl'):
                 # remove:
                 #        partially downloaded files
                 #        youtube-dl service files
                 os.remove(os.path.join(self.temp_dir, fl))
-        files = os.listdir(self.temp_dir)  # update the list of files
+        files = Bluetube._list_files(self.temp_dir)  # update the list
         if sender.found and sender.connect():
             sent += sender.send(files)
             sender.disconnect()
@@ -296,82 +473,313 @@ class Bluetube(EventPublisher):
                     return profiles
             raise ProfilesException('invalid profile')
 
-    def _get_list(self, feed: Feeds) -> list[Playlist]:
-        '''Fetch and parse RSS data for all lists.'''
-        pls = feed.get_all_playlists()
-
-        async def task(session, author):
-            '''task that fetches RSS for the author'''
-            events: list[Event] = [Info(author['author'], capture='RSS')]
-            for pl in author['playlists']:
-                events.append(Info('feed is fetching',
-                                   pl.title, capture='RSS'))
-                response = await self._fetch_rss(session, pl)
-                pl.feedparser_data = feedparser.parse(response)
-                pl.author = author['author']
+    def _get_list(self, feed: Feeds, full=False, offline=False,
+                  max_feed_age=None) -> list[Playlist]:
+        '''Fetch and parse RSS data for all lists.
+        Feeds that failed are reported and skipped,
+        feeds that are not expected to have updates are postponed.
+        Feeds fetched less than max_feed_age seconds ago are taken
+        from the cache, set offline to take all feeds from the cache.'''
+        options = self._get_configs().get_feeds_options()
+        cache = FeedCache(self.bt_dir, options['cache_ttl'])
+        # nothing is downloaded offline, so replay all cached feeds
+        scheduler = Scheduler(full or offline)
+        now = time.time()
+        pls = []
+        for a in feed.get_all_playlists():  # make the list flat
+            for pl in a['playlists']:
+                pl.author = a['author']
+                del pl.feedparser_data  # might be left by the previous run
+                pls.append(pl)
+        due = [pl for pl in pls if scheduler.is_due(pl, now)]
+        self._errors_left = options['error_budget']
+
+        async def parse(executor, pl, data):
+            '''parse the feed of the playlist'''
+            # parsing is CPU-bound, don't block other fetches;
+            # parse the whole feed to learn the cadence at first
+            newest_first = is_newest_first(pl.url) and bool(pl.publish_times)
+            loop = asyncio.get_running_loop()
+            pl.feedparser_data = await loop.run_in_executor(
+                executor, parse_feed, data, pl.last_update, newest_first)
+            pl.add_publish_times(pl.feedparser_data.published)
+
+        async def task(session, semaphore, executor, pl):
+            '''task that fetches RSS for the playlist'''
+            if offline or max_feed_age is not None:
+                data = cache.get(pl.url, max_feed_age)
+                if data is not None:
+                    await parse(executor, pl, data)
+                    return [Info('feed is fetching', pl.title,
+                                 capture='cache')]
+                if offline:
+                    return [Warn('feed not cached', pl.title)]
+            events = [Info('feed is fetching', pl.title, capture='RSS')]
+            try:
+                response = await self._fetch_with_retries(session, semaphore,
+                                                          pl, options)
+            except Bluetube.FETCH_ERRORS as e:
+                pl.set_fetch_failed(time.time())
+                events.append(Error('failed to fetch', pl.title, repr(e)))
+                return events
+            pl.reset_fetch_failures()
+            pl.last_fetch = now
+            if response is None:
+                self._debug(f'{pl.title} has not been modified')
+                cache.touch(pl.url)
+            else:
+                await parse(executor, pl, response)
+                await asyncio.get_running_loop().run_in_executor(
+                    None, cache.put, pl.url, response)
             return events
 
-        async def process_tasks():
+        async def process_tasks(executor):
             '''process all async tasks'''
-            timeout = aiohttp.ClientTimeout(total=60)
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                return await asyncio.gather(*[task(session, a) for a in pls],
-                                            return_exceptions=False)
+            semaphore = asyncio.Semaphore(options['concurrency'])
+            session = None if offline else await self._get_session(options)
+            return await asyncio.gather(*[task(session, semaphore,
+                                               executor, pl)
+                                          for pl in due])
 
         self.notify(Info('Updating feeds...'))
-        try:
-            events = asyncio.run(process_tasks())
-            # handles all event collected in the event loop
-            for event in events:
-                for e in event:
-                    self.notify(e)
-        except aiohttp.ClientConnectorError as e:
-            self.notify(Warn(e))  # notify the error immediately
-            self.notify(Error('no internet'))
-            os._exit(1)
-
-        pls = [pl for a in pls for pl in a['playlists']]  # make the list flat
+        results = self._run_fetching(process_tasks)
+        events = {id(pl): e for pl, e in zip(due, results)}
+        # handles all event collected in the event loop
+        author = None
+        for pl in due:
+            if pl.author != author:
+                author = pl.author
+                self.notify(Info(author, capture='RSS'))
+            for e in events[id(pl)]:
+                self.notify(e)
+        if len(due) < len(pls):
+            self.notify(Info('feeds postponed', len(pls) - len(due)))
+        if not offline:
+            if due and all(pl.fetch_failures for pl in due):
+                self.notify(Error('no internet'))
+            cache.prune()
+
         return pls
 
+    def _run_fetching(self, process_tasks):
+        '''run the coroutine made by process_tasks(executor)
+        in the event loop with the HTTP session and parser workers'''
+        if self._runner is None:
+            self._runner = asyncio.Runner()
+        if self._pool is None:
+            # a worker per CPU
+            self._pool = ProcessPoolExecutor(initializer=init_worker)
+        try:
+            return self._runner.run(process_tasks(self._pool))
+        finally:
+            if not self._keep_warm:
+                self._close_fetch_resources()
+
+    async def _fetch_with_retries(self, session, semaphore, pl, options):
+        '''fetch RSS for the playlist,
+        retry while the error budget of the run allows'''
+        attempt = 0
+        while True:
+            try:
+                async with semaphore:
+                    return await self._fetch_rss(session, pl)
+            except Bluetube.FETCH_ERRORS as e:
+                self._errors_left -= 1
+                if attempt == options['retries'] or self._errors_left <= 0 \
+                        or not self._is_retryable(e):
+                    raise
+                # exponential backoff with full jitter
+                delay = random.uniform(0, options['backoff'] * 2 ** attempt)
+                self._debug(f'retry {pl.url} in {delay:.1f}s: {e!r}')
+                attempt += 1
+                await asyncio.sleep(delay)
+
+    async def _get_session(self, options):
+        '''get the HTTP session, create a new one if options are changed'''
+        if self._session is not None and self._session_options != options:
+            await self._session.close()
+            self._session = None
+        if self._session is None:
+            connector = aiohttp.TCPConnector(
+                limit=options['concurrency'],
+                limit_per_host=options['connections_per_host'])
+            # limit every request rather than the whole phase,
+            # waiting for a free connection is not limited
+            timeout = aiohttp.ClientTimeout(total=None,
+                                            sock_connect=options['timeout'],
+                                            sock_read=options['timeout'])
+            self._session = aiohttp.ClientSession(connector=connector,
+                                                  timeout=timeout)
+            self._session_options = options
+        return self._session
+
+    def _close_fetch_resources(self):
+        '''close the HTTP session, the event loop and the workers'''
+        if self._session is not None:
+            self._runner.run(self._session.close())
+            self._session = None
+        if self._runner is not None:
+            self._runner.close()
+            self._runner = None
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def _get_configs(self):
+        '''get configurations, they are reloaded if the file changes'''
+        return self._load_cached('configs',
+                                 [os.path.join(self.bt_dir,
+                                               Configs.CONFIG_FILE_NAME)],
+                                 lambda: Configs(self.bt_dir))
+
+    def _get_store(self):
+        '''get the store of downloaded files'''
+        options = self._get_configs().get_download_options()
+        return DownloadStore(self.bt_dir, options['store_size'] * 2 ** 20)
+
+    def _load_cached(self, key, paths, load, force=False):
+        '''load an object once and reload it only if its files change;
+        set force to replace the cached object'''
+        stamp = get_files_stamp(paths)
+        cached = self._loaded.get(key)
+        if force or cached is None or cached[0] != stamp:
+            cached = (stamp, load())
+            self._loaded[key] = cached
+        return cached[1]
+
+    @staticmethod
+    def _is_retryable(error):
+        '''check if it makes sense to fetch a feed again'''
+        if isinstance(error, aiohttp.ClientResponseError):
+            return error.status >= 500 or error.status == 429
+        return True
+
     async def _fetch_rss(self, session, pl):
         '''get URLs from the RSS
-        that the user will selected for every playlist'''
+        that the user will selected for every playlist;
+        return None if the feed has not been modified since the last fetch'''
         headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64)'}
-        response = ''
+        # the validators are persisted along with last_update,
+        # so a 304 response means there is nothing new to process
+        if pl.etag:
+            headers['If-None-Match'] = pl.etag
+        if pl.last_modified:
+            headers['If-Modified-Since'] = pl.last_modified
         async with session.get(pl.url, headers=headers) as response:
-            response = await response.text()
-
-        return response
+            if response.status == 304:
+                return None
+            response.raise_for_status()
+            if response.status == 200:
+                pl.etag = response.headers.get('ETag')
+                pl.last_modified = response.headers.get('Last-Modified')
+            return await response.read()
 
-    def _process_playlists(self, pls):
+    def _process_playlists(self, pls, seen):
         '''ask the user what to do with the entities'''
         ret = []
         for pl in pls:
-            ret.append(self._process_playlist(pl))
+            ret.append(self._process_playlist(pl, seen))
         return ret
 
-    def _download_list(self, pl, profiles):
+    def _download_list(self, pl, profiles, seen):
         # keep path to successfully downloaded files for all profiles here
-        downloader = self.factory.get_downloader(self, self.temp_dir)
+        options = self._get_configs().get_download_options()
+        downloader = self.factory.get_downloader(self, self.temp_dir,
+                                                 options['engine'],
+                                                 self._get_store())
 
-        for profile, entities in pl.entities.items():
+        dl_ops = {}
+        for profile in pl.entities:
             if pl.output_format is OutputFormatType.audio:
-                dl_op = profiles.get_audio_options(profile)
+                dl_ops[profile] = profiles.get_audio_options(profile)
             elif pl.output_format is OutputFormatType.video:
-                dl_op = profiles.get_video_options(profile)
+                dl_ops[profile] = profiles.get_video_options(profile)
             else:
                 assert 0, 'unexpected output format type'
+        derived = self._derive_list(pl, dl_ops, downloader, options)
 
-            s, f = downloader.download(entities,
-                                       pl.output_format,
-                                       dl_op)
+        for profile, entities in pl.entities.items():
+            if profile in derived:
+                s, f = derived[profile]
+            else:
+                pr_op = {**options, **profiles.get_download_options(profile)}
+                s, f = downloader.download(entities,
+                                           pl.output_format,
+                                           dl_ops[profile],
+                                           pr_op['concurrency'],
+                                           pr_op['batch_size'])
             pl.entities[profile] = s
             if f:
-                ens = [e.title for e in f]
+                ens = [e.entity.title for e in f]
                 ens = ', '.join(ens)
                 event = Error('failed to download', ens, profile)
                 self.notify(event)
-            pl.add_failed_entities({profile: f})
+            pl.add_failed_entities({profile: [e.entity for e in f]})
+            for e in s:
+                seen.add(e.entity, SeenIndex.DOWNLOADED, pl.url)
+            for e in f:
+                seen.add(e.entity, SeenIndex.FAILED, pl.url)
+
+    def _derive_list(self, pl, dl_ops, downloader, options):
+        '''if profiles need different formats, download a file per video
+        and make files of the profiles from it locally;
+        return succeeded and failed entities of such profiles'''
+        converter = self.factory.get_converter(self, self.temp_dir)
+        groups = {}  # profiles by their download options
+        for profile, dl_op in dl_ops.items():
+            if converter.can_derive(pl.output_format, dl_op):
+                key = json.dumps(dl_op, sort_keys=True)
+                groups.setdefault(key, []).append(profile)
+        if len(groups) < 2 or not converter.is_available():
+            return {}
+
+        # files downloaded before are taken, others are made from sources
+        sources = {}
+        for profile in itertools.chain(*groups.values()):
+            for e in pl.entities[profile]:
+                if not downloader.lookup(e, pl.output_format,
+                                         dl_ops[profile]):
+                    sources.setdefault(e.entity.link, WorkItem(e.entity))
+        s, _ = downloader.download_sources(list(sources.values()),
+                                           pl.output_format,
+                                           [dl_ops[prs[0]]
+                                            for prs in groups.values()],
+                                           options['concurrency'],
+                                           options['batch_size'])
+        sources = {e.entity.link: e for e in s}
+
+        ret, used = {}, set()
+        for prs in groups.values():
+            dl_op = dl_ops[prs[0]]
+            made = {}  # DownloadInfo by link
+            for profile in prs:
+                s, f = [], []
+                for e in pl.entities[profile]:
+                    if e.info is None and e.entity.link in sources:
+                        if e.entity.link not in made:
+                            src = sources[e.entity.link]
+                            new = converter.derive(src.link,
+                                                   pl.output_format, dl_op)
+                            made[e.entity.link] = new and \
+                                downloader.add_variant(e.entity,
+                                                       pl.output_format,
+                                                       dl_op, new)
+                        e.info = made[e.entity.link]
+                        if e.info:
+                            e.link = e.info.filename
+                    if e.info is None:
+                        f.append(e)
+                    else:
+                        s.append(e)
+                        used.add(e.link)
+                ret[profile] = (s, f)
+
+        # the sources are kept in the store
+        for e in sources.values():
+            path = os.path.join(self.temp_dir, e.link)
+            if e.link not in used and os.path.exists(path):
+                os.remove(path)
+        return ret
 
     def _convert_list(self, pl, profiles):
         # convert video, audio has been converted by the downloader
@@ -393,7 +801,7 @@ class Bluetube(EventPublisher):
     def _send_list(self, pl, profiles):
         for profile, entities in pl.entities.items():
             s_op = profiles.get_send_options(profile)
-            links = [e['link'] for e in entities]
+            links = [e.link for e in entities]
             if not s_op or not links:
                 continue
             processed = []
@@ -418,7 +826,7 @@ class Bluetube(EventPublisher):
                 processed.append(copied)
 
             for en in entities:
-                lnk = en['link']
+                lnk = en.link
                 if all([lnk in pr for pr in processed]):
                     try:
                         os.remove(os.path.join(self.temp_dir, lnk))
@@ -453,7 +861,9 @@ class Bluetube(EventPublisher):
         '''return a sender from the cache for a device ID if possible
         or create a new one'''
         if device_id in self.senders:
-            return self.senders[device_id]
+            sender = self.senders[device_id]
+            sender.bluetube_dir = self.temp_dir  # of this run
+            return sender
         else:
             sender = BluetoothClient(device_id, self.temp_dir)
             if not sender.found:
@@ -565,49 +975,116 @@ class Bluetube(EventPublisher):
             del pl.author
         return [{'author': a, 'playlists': ret[a]} for a in ret]
 
-    def _process_playlist(self, pl):
-        '''process the playlist'''
+    def _process_playlist(self, pl, seen):
+        '''process the playlist;
+        skip videos that have been processed in other playlists'''
         entities = []
         channel_has_update = False
         new_last_update = last_update = pl.last_update
-        assert pl.feedparser_data is not None, 'fetch RSS first'
-        for e in pl.feedparser_data.entries:
-            e_update = time.mktime(e['published_parsed'])
+        if pl.feedparser_data is None:
+            # the feed has not been modified since the last fetch
+            pl.entities = entities
+            return pl
+        for entry in pl.feedparser_data.entries:
+            e = Entity.from_entry(entry)
+            e_update = e.published
             if last_update < e_update:
-                if not channel_has_update:
-                    self.notify(Info(pl.author))
-                    channel_has_update = True
-                if self.inputer.ask(e):
-                    entities.append(e)
+                if seen.is_seen_elsewhere(e, pl.url):
+                    self._debug(f'{e.title} has been processed '
+                                'in another playlist')
+                else:
+                    if not channel_has_update:
+                        self.notify(Info(pl.author))
+                        channel_has_update = True
+                    if self.inputer.ask(e):
+                        entities.append(e)
+                        seen.add(e, SeenIndex.ACCEPTED, pl.url)
+                    else:
+                        seen.add(e, SeenIndex.REJECTED, pl.url)
                 if new_last_update < e_update:
                     new_last_update = e_update
         pl.last_update = new_last_update
         pl.entities = entities
+        del pl.feedparser_data  # not needed anymore
         return pl
 
-    def _fetch_temp_dir(self):
+    def _fetch_temp_dir(self, isolated=False):
         '''fetch a temporal directory;
-        don't forget to return'''
-        temp_dir = os.path.join(tempfile.gettempdir(), 'bluetube')
+        an isolated one is a directory of this run,
+        so several runs don't touch files of each other;
+        it is in the home directory to link files of the download store
+        on the same file system; don't forget to return'''
+        temp_dir = Bluetube._get_outbox()
         if not os.path.isdir(temp_dir):
             os.mkdir(temp_dir)
         else:
-            fs = os.listdir(temp_dir)
+            fs = Bluetube._list_files(temp_dir)
             if len(fs):
                 msg = 'Ready to be sent:\n{}'.format('\n'.join(fs))
                 self.notify(Warn(msg))
+        if isolated:
+            runs_dir = os.path.join(self.bt_dir, Bluetube.RUNS_DIRNAME)
+            os.makedirs(runs_dir, exist_ok=True)
+            temp_dir = tempfile.mkdtemp(prefix='run-', dir=runs_dir)
         self.temp_dir = temp_dir
 
     def _return_temp_dir(self):
         assert self.temp_dir, 'nothing to return, call fetch'
-        if os.path.isdir(self.temp_dir):
-            try:
-                os.rmdir(self.temp_dir)
-            except OSError:
-                event = Warn('download directory not empty', self.temp_dir)
+        outbox = Bluetube._get_outbox()
+        if self.temp_dir != outbox and os.path.isdir(self.temp_dir):
+            # leave the files that are not sent for the send command;
+            # an error must not hide the one of a failed run
+            left = False
+            for f in Bluetube._list_files(self.temp_dir):
+                try:
+                    # another run might have removed it if it was empty
+                    os.makedirs(outbox, exist_ok=True)
+                    shutil.move(os.path.join(self.temp_dir, f),
+                                Bluetube._get_free_path(outbox, f))
+                except OSError as e:
+                    left = True
+                    self.notify(Warn('file not moved', f, self.temp_dir,
+                                     repr(e)))
+            if not left:
+                shutil.rmtree(self.temp_dir, ignore_errors=True)
+        self.temp_dir = outbox
+        if os.path.isdir(outbox):
+            files = Bluetube._list_files(outbox)
+            if files:
+                event = Warn('download directory not empty', outbox)
                 self.notify(event)
-                event = Warn('\n  '.join(os.listdir(self.temp_dir)))
+                event = Warn('\n  '.join(files))
                 self.notify(event)
+            else:
+                try:
+                    os.rmdir(outbox)
+                except OSError:
+                    pass  # another run has put files meanwhile
+
+    @staticmethod
+    def _get_outbox():
+        '''get the directory shared by all runs
+        where the files that are not sent yet are kept'''
+        return os.path.join(tempfile.gettempdir(), 'bluetube')
+
+    @staticmethod
+    def _get_free_path(directory, name):
+        '''get a path to a file of the name in the directory,
+        a number is added to the name if such a file exists
+        e.g. it is put by another run'''
+        path = os.path.join(directory, name)
+        base, ext = os.path.splitext(name)
+        n = 1
+        while os.path.exists(path):
+            path = os.path.join(directory, f'{base} ({n}){ext}')
+            n += 1
+        return path
+
+    @staticmethod
+    def _list_files(directory):
+        '''list files of the directory skipping directories'''
+        return [f for f in os.listdir(directory)
+                if not os.path.isdir(os.path.join(directory, f))]
 
     def _get_bt_dir(self, home_dir):
         bt_dir = home_dir if home_dir else Bluetube.HOME_DIR
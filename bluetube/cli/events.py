@@ -17,7 +17,12 @@ class Success(Event):
     '''A successful event.'''
     MSGS = {
         'added': '{} by {} added successfully.',
-        'feeds updated': "Feeds have been updated successfully."
+        'feeds updated': "Feeds have been updated successfully.",
+        'imported': '{} playlists imported.',
+        'exported': '{} playlists exported to {}.',
+        'db exported': 'The DB exported to {}.',
+        'backed up': '{} playlists saved to {}.',
+        'restored': '{} playlists restored from {}.',
         }
 
     def __init__(self, msg: str, *args, **kwargs) -> None:
@@ -32,14 +37,17 @@ class Error(Event):
         'playlist not found': '"{}" by "{}" not found',
         'downloader not found': 'The tool for downloading "{}"'
                                 ' is not found in PATH',
+        'failed to fetch': 'Failed to fetch "{}": {}',
         'failed to download': 'Failed to download "{}" for "{}"',
         'converter not found': 'The tool for converting video "{}"'
                                ' is not found in PATH',
         'failed to convert': 'Failed to convert the file {}.',
+        'run failed': 'The run has failed: {}',
         'misformatted URL': '''Misformatted URL of the youtube list.
 Should be https://www.youtube.com/watch?v=XXX&list=XXX for a playlist,
 or https://www.youtube.com/feeds/videos.xml?playlist_id=XXX for a channel.''',
         'playlist exists': 'The playlist {} by {} has already existed',
+        'not a feed': '"{}" is not a feed',
         'the base profile not found': '''The base profile is not found.
 Check the config file. It must have something like this
 [__base__]
@@ -62,6 +70,9 @@ class Info(Event):
         'empty database': 'No subscribed playlists.\n'
                           'Run "bluetube add -h" for more info.',
         'feed is fetching': ' ' * INDENTATION + '{}',
+        'feeds postponed': '{} feeds are not expected to have updates '
+                           'or failed recently. Run with --full '
+                           'to fetch them.',
         'converter not found': 'Please install the converter.',
         }
 
@@ -72,11 +83,15 @@ class Info(Event):
 class Warn(Event):
     '''A warning event.'''
     MSGS = {
+        'feed not cached': '"{}" is not in the cache of feeds.',
+        'engine not found': 'The "{}" engine needs the yt-dlp package, '
+                            'the yt-dlp command is used instead.',
         'device not found': 'Your bluetooth device is not accessible.\n'
                             'The script will download files to {} directory.',
         'download directory not empty': 'The download directory {} '
                                         'is not empty. Run "bluetube -s" '
                                         'to send the files or remove them.',
+        'file not moved': 'The file {} is left in {}: {}',
         'conversion is not needed': 'The files is in required format. '
                                     'No conversion needed.',
         'no editor': 'Specify your favorite text editor '
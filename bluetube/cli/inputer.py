@@ -1,3 +1,5 @@
+import time
+
 from bluetube.cli.bcolors import Bcolors
 from bluetube.cli.cli import CLI
 from bluetube.cli.events import INDENTATION, Event
@@ -32,7 +34,7 @@ class Inputer(CLI):
         open_browser = ['b', 'B', 'и', 'И']
         open_player = ['p', 'P', 'З', 'з']
 
-        link = feed_entry['link']
+        link = feed_entry.link
         while True:
             i = input('{}\n'.format(self._make_question_to_ask(feed_entry)))
             i = i.strip()
@@ -41,7 +43,7 @@ class Inputer(CLI):
             elif i in r:
                 return False
             elif i in s:
-                print('Summary:\n{}'.format(feed_entry['summary']))
+                print('Summary:\n{}'.format(feed_entry.summary))
             elif i in open_browser:
                 self._executor.open_url(link)
             elif i in open_player:
@@ -53,16 +55,16 @@ class Inputer(CLI):
                 if self._player:
                     msg += ', {} to open in a media player'
                     params += (open_player[0], )
-                if feed_entry['summary']:
+                if feed_entry.summary:
                     msg += ', {} to get a summary'
                     params += (s[0], )
                 msg += '.{}'.format(Bcolors.ENDC)
                 Bcolors.error(msg.format(*params))
 
     def _make_question_to_ask(self, feed_entry):
-        pub = feed_entry['published_parsed']
+        pub = time.localtime(feed_entry.published)
         params = {'ind': 2 * INDENTATION * ' ',
-                  'tit': feed_entry['title'],
+                  'tit': feed_entry.title,
                   'h': pub.tm_hour,
                   'min': pub.tm_min,
                   'd': pub.tm_mday,
@@ -77,7 +79,7 @@ class Inputer(CLI):
             msg = ' | open in a media {b}p{e}layer'.format(b=Bcolors.HEADER,
                                                            e=Bcolors.ENDC)
             question += msg
-        if feed_entry['summary']:
+        if feed_entry.summary:
             question += ' | {b}s{e}ummary'.format(b=Bcolors.HEADER,
                                                   e=Bcolors.ENDC)
         return question
@@ -6,17 +6,18 @@ import webbrowser
 
 
 def cache(func):
-    '''a method decorator for cache'''
+    '''a method decorator for cache;
+    results are kept by arguments until the cache is cleared'''
     cache.cache = {}
 
     @functools.wraps(func)
     def wrapper(self, *args, **kwargs):
-        str_args = ' '.join(args[0])
-        if str_args in cache.cache:
-            return cache.cache[str_args]
+        key = (func.__name__, args, tuple(sorted(kwargs.items())))
+        if key in cache.cache:
+            return cache.cache[key]
         else:
             ret = func(self, *args, **kwargs)
-            cache.cache[str_args] = ret
+            cache.cache[key] = ret
             return ret
     return wrapper
 
@@ -28,7 +29,11 @@ class CommandExecutor(object):
         cache.cache = {}
         self._debug = logging.getLogger(__name__).debug
 
-    @cache
+    def clear_cache(self):
+        '''forget the probed commands e.g. a tool might be installed
+        since the previous run of the daemon'''
+        cache.cache = {}
+
     def call(self, args, cwd=None,
              suppress_stdout=False, suppress_stderr=False):
         if cwd is None:
@@ -53,6 +58,7 @@ class CommandExecutor(object):
         self._debug(f'Return code: {return_code}')
         return return_code
 
+    @cache
     def does_command_exist(self, name, dashes=2):
         '''call a command with the given name
         and expects that it has option --version'''
@@ -2,11 +2,16 @@
 The factory.
 '''
 
+from typing import Optional
+
 from bluetube.cli import Inputer, Outputer
+from bluetube.cli.events import Warn
 from bluetube.commandexecutor import CommandExecutor
 from bluetube.converter import FfmpegConverter
+from bluetube.downloadstore import DownloadStore
 from bluetube.eventpublisher import EventPublisher
 from bluetube.ytdldownloader import YoutubeDlDownloader
+from bluetube.ytdlpengine import YtDlpEngine
 
 
 class ComponentFactory(object):
@@ -14,16 +19,37 @@ class ComponentFactory(object):
     A factory that makes all bluetube components.
     '''
 
+    # engines of the downloader
+    SUBPROCESS = 'subprocess'
+    IN_PROCESS = 'in-process'
+
     def get_command_executor(self):
         '''Get a object to start OS processes.'''
         if not hasattr(self, '_executor'):
             self._executor = CommandExecutor()
         return self._executor
 
-    def get_downloader(self, publisher: EventPublisher, temp_dir: str):
-        '''Get a downloader.'''
-        ex = self.get_command_executor()
-        return YoutubeDlDownloader(ex, publisher, temp_dir)
+    def get_downloader(self, publisher: EventPublisher, temp_dir: str,
+                       engine: str = SUBPROCESS,
+                       store: Optional[DownloadStore] = None):
+        '''Get a downloader, the engine is the yt-dlp command
+        or the yt-dlp package if it is installed.
+        It is reused for every directory e.g. runs of the daemon,
+        so the in-process engine keeps its state.'''
+        if not hasattr(self, '_downloaders'):
+            self._downloaders = {}
+        if engine not in self._downloaders:
+            ex = self.get_command_executor()
+            cls = YoutubeDlDownloader
+            if engine == ComponentFactory.IN_PROCESS:
+                if YtDlpEngine.is_available():
+                    cls = YtDlpEngine
+                else:
+                    publisher.notify(Warn('engine not found', engine))
+            self._downloaders[engine] = cls(ex, publisher, temp_dir, store)
+        else:
+            self._downloaders[engine].set_temp_dir(temp_dir, store)
+        return self._downloaders[engine]
 
     def get_converter(self, publisher: EventPublisher, temp_dir: str):
         ex = self.get_command_executor()
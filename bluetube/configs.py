@@ -9,6 +9,18 @@ class Configs(object):
     Manages bluetube configurations in conf.toml.
     '''
     CONFIG_FILE_NAME = 'configs.toml'
+    # used if the file has been created by an older version
+    FEEDS_DEFAULTS = {'concurrency': 32,
+                      'connections_per_host': 8,
+                      'timeout': 20,
+                      'retries': 2,
+                      'backoff': 1.0,
+                      'error_budget': 20,
+                      'cache_ttl': 7 * 24 * 60 * 60}
+    DOWNLOAD_DEFAULTS = {'concurrency': 4,
+                         'batch_size': 10,
+                         'engine': 'subprocess',
+                         'store_size': 2048}
 
     @staticmethod
     def create_configs(bt_dir):
@@ -43,6 +55,15 @@ class Configs(object):
         self._configs['media_player']['default'] = player
         self._dump()
 
+    def get_feeds_options(self) -> dict:
+        '''get options to fetch feeds'''
+        return {**Configs.FEEDS_DEFAULTS, **self._configs.get('feeds', {})}
+
+    def get_download_options(self) -> dict:
+        '''get options to download videos'''
+        return {**Configs.DOWNLOAD_DEFAULTS,
+                **self._configs.get('download', {})}
+
     def _dump(self):
         with open(self._config_path, 'w') as f:
             toml.dump(self._configs, f)
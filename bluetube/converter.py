@@ -9,6 +9,7 @@ from bluetube.cli.events import Error, Info, Warn
 from bluetube.cli.inputer import Inputer
 from bluetube.commandexecutor import CommandExecutor
 from bluetube.eventpublisher import EventPublisher
+from bluetube.model import OutputFormatType
 
 
 class FfmpegConverter(object):
@@ -18,6 +19,17 @@ class FfmpegConverter(object):
     NAME = 'ffmpeg'
     # keep files that failed to be converted here
     NOT_CONV_DIR = '[not yet converted files]'
+    # encoders of audio formats of the downloader
+    # and their options of the worst quality as it downloads
+    AUDIO_CODECS = {'mp3': ('-codec:a', 'libmp3lame', '-q:a', '9'),
+                    'aac': ('-codec:a', 'aac', '-b:a', '64k'),
+                    'm4a': ('-codec:a', 'aac', '-b:a', '64k'),
+                    'opus': ('-codec:a', 'libopus', '-b:a', '32k'),
+                    'vorbis': ('-codec:a', 'libvorbis', '-q:a', '0'),
+                    'flac': ('-codec:a', 'flac'),
+                    'wav': ('-codec:a', 'pcm_s16le'),
+                    }
+    AUDIO_EXTENSIONS = {'aac': 'm4a', 'vorbis': 'ogg'}
 
     def __init__(self, executor: CommandExecutor,
                  publisher: EventPublisher,
@@ -43,7 +55,7 @@ class FfmpegConverter(object):
         codecs_options = tuple(codecs_options.split())
         output_format = configs['output_format']
         for en in entities:
-            orig = en['link']
+            orig = en.link
             new = os.path.splitext(orig)[0] + '.' + output_format
             if orig == new:
                 self._publisher.notify(Warn('conversion is not needed'))
@@ -53,7 +65,7 @@ class FfmpegConverter(object):
                 codecs_options + (new,)
             if not 1 == self._executor.call(args, cwd=self._temp_dir):
                 os.remove(os.path.join(self._temp_dir, orig))
-                en['link'] = new
+                en.link = new
                 success.append(en)
             else:
                 failure.append(en)
@@ -67,6 +79,50 @@ class FfmpegConverter(object):
                                             f'the script is done.'))
         return success, failure
 
+    def is_available(self):
+        '''check if the converter is installed'''
+        return self._executor.does_command_exist(FfmpegConverter.NAME,
+                                                 dashes=1)
+
+    @staticmethod
+    def can_derive(output_format, configs):
+        '''check if a file for the download configs can be made
+        from a downloaded one, a video format must be a container'''
+        if output_format is OutputFormatType.audio:
+            return configs['output_format'] in \
+                ('best',) + tuple(FfmpegConverter.AUDIO_CODECS)
+        return (configs.get('output_format') or 'best').isalnum()
+
+    def derive(self, orig, output_format, configs):
+        '''make a file for the download configs from the downloaded one
+        as the downloader would download it, the original file is kept;
+        return the name of the file or None if it fails'''
+        of = configs.get('output_format')
+        if of in ('best', '', None):
+            return orig  # the downloaded file is the best one
+        if output_format is OutputFormatType.audio:
+            # extract the audio, convert to mono
+            attempts = [('-vn', '-ac', '1') + FfmpegConverter.AUDIO_CODECS[of]]
+            of = FfmpegConverter.AUDIO_EXTENSIONS.get(of, of)
+        else:
+            # remux, convert if the container does not support the streams
+            attempts = [('-codec', 'copy'), ()]
+        new = os.path.splitext(orig)[0] + '.' + of
+        if new == orig:
+            return orig  # the downloaded file is in the format
+        options = ('-y',  # overwrite output files
+                   '-hide_banner',)
+        src, dest = (os.path.join(self._temp_dir, f) for f in (orig, new))
+        for args in attempts:
+            args = (FfmpegConverter.NAME,) + options + ('-i', src) + args + \
+                (dest,)
+            if not self._executor.call(args, cwd=self._temp_dir):
+                return new
+        if os.path.exists(dest):
+            os.remove(dest)
+        self._publisher.notify(Error('failed to convert', orig))
+        return None
+
     def _check_video_converter(self):
         if not self._executor.does_command_exist(FfmpegConverter.NAME,
                                                  dashes=1):
@@ -0,0 +1,109 @@
+'''
+The on-disk store of downloaded files.
+'''
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+from bluetube.model import DownloadInfo
+
+
+class DownloadStore(object):
+    '''
+    Keeps downloaded files for all profiles and runs, a directory
+    per video and format options with the file and its description.
+    Files are given by hard links, so they take no space twice;
+    they are copied if the directories are on different file systems.
+    The modification time of a directory is the time it was used,
+    the least recently used ones are removed if the store is too big.
+    '''
+
+    DIRNAME = 'downloads'
+    INFO = 'info.json'
+
+    def __init__(self, bt_dir, max_size):
+        '''max_size is the size (in bytes) of all files,
+        0 disables the store'''
+        self.store_dir = os.path.join(bt_dir, DownloadStore.DIRNAME)
+        self.max_size = max_size
+        self._copying = False  # reported once
+        self._warn = logging.getLogger(__name__).warning
+
+    def get_path(self, video_id, options):
+        '''get the path to the directory of the video
+        downloaded with the options'''
+        key = json.dumps([video_id, list(options)])
+        name = hashlib.sha1(key.encode()).hexdigest()
+        return os.path.join(self.store_dir, name)
+
+    def get(self, video_id, options, dest_dir):
+        '''put the stored file into dest_dir and get its DownloadInfo;
+        None if there is no such file'''
+        if not self.max_size:
+            return None
+        path = self.get_path(video_id, options)
+        try:
+            with open(os.path.join(path, DownloadStore.INFO)) as f:
+                info = DownloadInfo(**json.load(f))
+            dest = os.path.join(dest_dir, info.filename)
+            if not os.path.exists(dest):
+                self._link(os.path.join(path, info.filename), dest)
+            os.utime(path)  # used now
+            return info
+        except (OSError, ValueError, TypeError):
+            return None  # e.g. removed by another process meanwhile
+
+    def put(self, video_id, options, src_dir, info):
+        '''put the file described by info from src_dir to the store'''
+        if not self.max_size:
+            return
+        os.makedirs(self.store_dir, exist_ok=True)
+        tmp = tempfile.mkdtemp(dir=self.store_dir, prefix='.')
+        try:
+            self._link(os.path.join(src_dir, info.filename),
+                       os.path.join(tmp, info.filename))
+            with open(os.path.join(tmp, DownloadStore.INFO), 'w') as f:
+                json.dump({s: getattr(info, s) for s in info.__slots__}, f)
+            # readers never see a partial directory
+            os.replace(tmp, self.get_path(video_id, options))
+        except OSError:
+            pass  # e.g. stored by another process meanwhile
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    def prune(self):
+        '''remove the least recently used files
+        while the store is bigger than its maximum size'''
+        if not os.path.isdir(self.store_dir):
+            return
+        entries = []
+        for name in os.listdir(self.store_dir):
+            if name.startswith('.'):
+                continue  # being put
+            path = os.path.join(self.store_dir, name)
+            try:
+                size = sum(e.stat().st_size for e in os.scandir(path))
+                entries.append((os.path.getmtime(path), size, path))
+            except OSError:
+                pass
+        total = 0
+        for _, size, path in sorted(entries, reverse=True):
+            total += size
+            if total > self.max_size:
+                shutil.rmtree(path, ignore_errors=True)
+
+    def _link(self, src, dest):
+        '''make a hard link, copy the file if it is not possible
+        e.g. the directories are on different file systems'''
+        try:
+            os.link(src, dest)
+        except OSError as e:
+            if not self._copying:
+                self._copying = True
+                self._warn(f'files of {self.store_dir} are copied, '
+                           f'they cannot be linked: {e}')
+            shutil.copy2(src, dest)
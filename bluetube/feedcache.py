@@ -0,0 +1,82 @@
+'''
+The on-disk cache of fetched feeds.
+'''
+
+import gzip
+import hashlib
+import os
+import tempfile
+import time
+
+
+class FeedCache(object):
+    '''
+    Keeps raw bodies of fetched feeds compressed, a file per feed.
+    The modification time of a file is the time the feed was fetched.
+    '''
+
+    DIRNAME = 'feeds_cache'
+    SUFFIX = '.xml.gz'
+
+    def __init__(self, bt_dir, ttl):
+        '''ttl is the time (in seconds) feeds are kept, 0 disables the cache'''
+        self.cache_dir = os.path.join(bt_dir, FeedCache.DIRNAME)
+        self.ttl = ttl
+
+    def get_path(self, url):
+        '''get the path to the cached feed'''
+        name = hashlib.sha1(url.encode()).hexdigest()
+        return os.path.join(self.cache_dir, name + FeedCache.SUFFIX)
+
+    def get(self, url, max_age=None):
+        '''get the cached feed if it is younger than max_age (in seconds)
+        and the TTL; None if there is no such feed'''
+        if not self.ttl:
+            return None
+        path = self.get_path(url)
+        try:
+            age = time.time() - os.path.getmtime(path)
+            if age > self.ttl or (max_age is not None and age > max_age):
+                return None
+            with gzip.open(path, 'rb') as f:
+                return f.read()
+        except (OSError, EOFError):
+            return None
+
+    def put(self, url, data):
+        '''put the fetched feed to the cache;
+        errors are ignored, the cache is only an optimisation'''
+        if not self.ttl:
+            return
+        tmp = None
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # a file of its own, other runs might put the same feed
+            fd, tmp = tempfile.mkstemp(dir=self.cache_dir, prefix='.',
+                                       suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f, gzip.open(f, 'wb') as gz:
+                gz.write(data)
+            os.replace(tmp, self.get_path(url))  # readers never see a part
+        except OSError:
+            if tmp is not None and os.path.exists(tmp):
+                os.remove(tmp)
+
+    def touch(self, url):
+        '''mark the cached feed as fetched now e.g. if it is not modified'''
+        try:
+            os.utime(self.get_path(url))
+        except OSError:
+            pass
+
+    def prune(self):
+        '''remove feeds older than the TTL'''
+        if not os.path.isdir(self.cache_dir):
+            return
+        expired = time.time() - self.ttl
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            try:
+                if os.path.getmtime(path) < expired:
+                    os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,130 @@
+'''
+Parsing of RSS feeds.
+
+The functions of this module are called in worker processes,
+so they must be picklable and return only small picklable data.
+'''
+
+import datetime
+import signal
+import time
+from xml.etree import ElementTree
+
+import feedparser
+
+# the fields of a feed entry used to ask the user,
+# to download a video and to add metadata to the file
+ENTRY_FIELDS = ('yt_videoid', 'link', 'title', 'author',
+                'summary', 'published_parsed')
+
+ATOM = '{http://www.w3.org/2005/Atom}'
+MEDIA = '{http://search.yahoo.com/mrss/}'
+YT_NAMESPACE = 'http://www.youtube.com/xml/schemas/2015'
+YT = '{' + YT_NAMESPACE + '}'
+
+CHUNK_SIZE = 8192
+
+
+class NotYoutubeFeed(Exception):
+    '''The document is not a YouTube feed.'''
+
+
+def init_worker():
+    '''initialize a worker process;
+    Ctrl+c is handled by the main process'''
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def is_newest_first(url):
+    '''check if entries of the feed are sorted by date, newest first;
+    playlists are sorted by their position'''
+    return 'channel_id=' in url
+
+
+def parse_feed(data, last_update=0, newest_first=False):
+    '''parse the feed and keep only entries published after last_update
+    with the fields that are needed to process a playlist;
+    if entries are sorted newest first, stop at the first old entry;
+    the publish times of all parsed entries are returned as well'''
+    try:
+        entries, published = [], []
+        for e in iter_youtube_entries(data):
+            t = _get_time(e)
+            if t is not None:
+                published.append(t)
+            if _is_new(t, last_update):
+                entries.append(e)
+            elif newest_first:
+                break
+    except (NotYoutubeFeed, ElementTree.ParseError, ValueError):
+        entries, published = [], []
+        for e in feedparser.parse(data).entries:
+            t = _get_time(e)
+            if t is not None:
+                published.append(t)
+            if _is_new(t, last_update):
+                entries.append(feedparser.FeedParserDict(
+                    {f: e.get(f) for f in ENTRY_FIELDS}))
+    return feedparser.FeedParserDict(entries=entries, published=published)
+
+
+def parse_feed_info(data):
+    '''get the title and the author of the feed,
+    None if it is not a feed'''
+    feed = feedparser.parse(data).feed
+    if 'title' not in feed:
+        return None
+    return {'title': feed.title, 'author': feed.get('author', feed.title)}
+
+
+def iter_youtube_entries(data):
+    '''parse the YouTube feed incrementally and yield its entries;
+    raise NotYoutubeFeed if it is another feed'''
+    parser = ElementTree.XMLPullParser(events=('start-ns', 'start', 'end'))
+    has_yt_namespace = False
+    root = None
+    for i in range(0, len(data), CHUNK_SIZE):
+        parser.feed(data[i:i + CHUNK_SIZE])
+        for event, elem in parser.read_events():
+            if event == 'start-ns':
+                has_yt_namespace |= elem[1] == YT_NAMESPACE
+            elif event == 'start':
+                if root is None:
+                    root = elem
+                    if elem.tag != ATOM + 'feed' or not has_yt_namespace:
+                        raise NotYoutubeFeed()
+            elif elem.tag == ATOM + 'entry':
+                yield _make_entry(elem)
+                root.remove(elem)  # free memory
+    parser.close()
+
+
+def _make_entry(elem):
+    '''make an entry from an Atom element'''
+    link = None
+    for ln in elem.iterfind(ATOM + 'link'):
+        if ln.get('rel', 'alternate') == 'alternate':
+            link = ln.get('href')
+            break
+    published = elem.findtext(ATOM + 'published')
+    if published:
+        published = datetime.datetime.fromisoformat(published).utctimetuple()
+    return feedparser.FeedParserDict(
+        yt_videoid=elem.findtext(YT + 'videoId'),
+        link=link,
+        title=elem.findtext(ATOM + 'title'),
+        author=elem.findtext(f'{ATOM}author/{ATOM}name'),
+        summary=elem.findtext(f'{MEDIA}group/{MEDIA}description'),
+        published_parsed=published)
+
+
+def _get_time(entry):
+    '''get the publish time of the entry the same way
+    as Bluetube._process_playlist does'''
+    published = entry.get('published_parsed')
+    return time.mktime(published) if published else None
+
+
+def _is_new(published, last_update):
+    '''check if the entry has been published after the last update'''
+    return published is not None and last_update < published
@@ -1,9 +1,15 @@
+import contextlib
+import datetime
 import dbm
 import functools
+import glob
+import itertools
+import json
 import os
 import shelve
+import sqlite3
 
-from bluetube.model import OutputFormatType, Playlist
+from bluetube.model import Entity, OutputFormatType, Playlist
 from bluetube.version import __version__
 
 '''
@@ -25,9 +31,50 @@ from bluetube.version import __version__
 
 
 class Feeds(object):
-    '''Manages RSS feeds in the shelve database'''
-
-    DBFILENAME = 'bluetube.db'
+    '''Manages RSS feeds in the SQLite database'''
+
+    DBFILENAME = 'bluetube.sqlite3'
+    # the shelve DB of older versions, it is migrated once
+    SHELVE_DBFILENAME = 'bluetube.db'
+    SCHEMA_VERSION = 1
+    SCHEMA = '''
+CREATE TABLE IF NOT EXISTS author(
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS playlist(
+    id INTEGER PRIMARY KEY,
+    author_id INTEGER NOT NULL REFERENCES author(id) ON DELETE CASCADE,
+    title TEXT NOT NULL,
+    url TEXT NOT NULL,
+    out_format TEXT NOT NULL,
+    profiles TEXT NOT NULL,
+    last_update REAL NOT NULL DEFAULT 0,
+    etag TEXT,
+    last_modified TEXT,
+    fetch_failures INTEGER NOT NULL DEFAULT 0,
+    last_fetch_failure REAL NOT NULL DEFAULT 0,
+    last_fetch REAL NOT NULL DEFAULT 0,
+    publish_times TEXT NOT NULL DEFAULT '[]',
+    UNIQUE(author_id, title)
+);
+CREATE TABLE IF NOT EXISTS failed_entity(
+    id INTEGER PRIMARY KEY,
+    playlist_id INTEGER NOT NULL REFERENCES playlist(id) ON DELETE CASCADE,
+    profile TEXT NOT NULL,
+    entity TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS failed_entity_playlist
+    ON failed_entity(playlist_id);
+'''
+    # the columns of a playlist row that might be changed
+    COLUMNS = ('url', 'out_format', 'profiles', 'last_update', 'etag',
+               'last_modified', 'fetch_failures', 'last_fetch_failure',
+               'last_fetch', 'publish_times')
+    # the number of playlists restored at once
+    BATCH_SIZE = 500
+    # wait for another process writing the DB so many seconds
+    LOCK_TIMEOUT = 60
 
     class Decor(object):
         @staticmethod
@@ -35,155 +82,593 @@ class Feeds(object):
             @functools.wraps(func)
             def wrapper(*args, **kwargs):
                 self = args[0]
-                if not len(self._feeds):
+                if not self._pulled:
                     self._pull()
                 return func(*args, **kwargs)
             return wrapper
 
     def __init__(self, db_dir):
-        self.db_file = os.path.join(db_dir, Feeds.DBFILENAME)
-        self._feeds = []
+        self.db_file = Feeds.get_db_file(db_dir)
+        self.shelve_db_file = os.path.join(db_dir, Feeds.SHELVE_DBFILENAME)
+        # author -> {'author': author, 'playlists': [...]} in the order
+        # authors are added, and (author, title) -> playlist
+        self._authors = {}
+        self._playlists = {}
+        self._pulled = False
+        # (author, title) -> playlist ID of playlists in the DB
+        self._ids = {}
+
+    @staticmethod
+    def get_db_file(db_dir):
+        '''get the path to the DB'''
+        return os.path.join(db_dir, Feeds.DBFILENAME)
+
+    @staticmethod
+    def get_db_files(db_dir):
+        '''get all files of the DB including its journal'''
+        return glob.glob(glob.escape(Feeds.get_db_file(db_dir)) + '*')
 
     @Decor.pull_if_needed
     def add_playlist(self, author, title, url, out_format, profiles):
         '''add a playlist'''
+        self._add_playlist(author, title, url, out_format, profiles)
+        self.sync()
+
+    @Decor.pull_if_needed
+    def add_playlists(self, playlists, out_format, profiles):
+        '''add playlists given as (author, title, url),
+        write the DB once'''
+        for author, title, url in playlists:
+            self._add_playlist(author, title, url, out_format, profiles)
+        self.sync()
+
+    def _add_playlist(self, author, title, url, out_format, profiles):
         pl = Playlist(title, url)
         pl.set_output_format_type(out_format)
         pl.profiles = profiles
-        for a in self._feeds:
-            if a['author'] == author:
-                a['playlists'].append(pl)
-                break
-        else:
-            self._feeds.append({'author': author,
-                                'playlists': [pl]})
-        self._push()
+        self._index_playlist(author, pl)
+
+    def _index_playlist(self, author, pl):
+        '''add the playlist to the indexes'''
+        a = self._authors.get(author)
+        if a is None:
+            a = self._authors[author] = {'author': author, 'playlists': []}
+        a['playlists'].append(pl)
+        self._playlists[(author, pl.title)] = pl
 
     @Decor.pull_if_needed
     def get_playlist(self, author, title):
         '''get a playlist'''
-        for a in self._feeds:
-            if a['author'] == author:
-                pls = a['playlists']
-                break
-        else:
-            return
-
-        for pl in pls:
-            if pl.title == title:
-                return pl
+        return self._playlists.get((author, title))
 
     @Decor.pull_if_needed
     def get_all_playlists(self):
         '''get all playlists'''
-        return self._feeds
+        return list(self._authors.values())
 
+    @Decor.pull_if_needed
     def set_all_playlists(self, pls):
         '''update playlists'''
-        self._feeds = pls
+        self._authors = {}
+        self._playlists = {}
+        for a in pls:
+            for pl in a['playlists']:
+                self._index_playlist(a['author'], pl)
 
+    @Decor.pull_if_needed
     def sync(self):
-        '''persist all playlists'''
-        self._push()
+        '''persist all playlists; only changed fields are written,
+        all changes are written in one transaction'''
+        with self._transaction(write=True) as db:
+            removed = self._ids.keys() - self._playlists.keys()
+            for key in removed:
+                db.execute('DELETE FROM playlist WHERE id = ?',
+                           (self._ids.pop(key),))
+            gone = []
+            for key, pl in self._playlists.items():
+                if key not in self._ids:
+                    self._ids[key] = Feeds._insert_playlist(db, *key, pl)
+                elif pl.dirty and \
+                        not Feeds._update_playlist(db, self._ids[key], pl):
+                    gone.append(key)
+                pl.clean()
+            if removed:
+                db.execute('DELETE FROM author WHERE id NOT IN '
+                           '(SELECT author_id FROM playlist)')
+        # don't bring back playlists removed by another process
+        for key in gone:
+            del self._ids[key]
+        self._unindex_playlists(gone)
 
     @Decor.pull_if_needed
     def get_authors(self):
-        return [a['author'] for a in self._feeds]
+        return list(self._authors)
 
     @Decor.pull_if_needed
     def has_playlist(self, author, title):
-        a_t = {a['author']: [p.title for p in a['playlists']]
-               for a in self._feeds}
-        return author in a_t and title in a_t[author]
+        return (author, title) in self._playlists
 
-    @Decor.pull_if_needed
     def remove_playlist(self, author, title):
         '''remove the title of the author;
         remove the author if it has no more titles'''
-        for a in self._feeds:
-            if a['author'] == author:
-                playlists = a['playlists']
-                for ls in playlists:
-                    if ls.title == title:
-                        playlists.remove(ls)
-                        if not len(playlists):
-                            self._feeds.remove(a)
-                        self._push()
-                        return
+        self.remove_playlists([(author, title)])
+
+    @Decor.pull_if_needed
+    def remove_playlists(self, playlists):
+        '''remove playlists given as (author, title),
+        write the DB once'''
+        if self._unindex_playlists(playlists):
+            self.sync()
+
+    def _unindex_playlists(self, playlists):
+        '''remove playlists given as (author, title) from the indexes;
+        return True if any of them has been found'''
+        authors = set()
+        for key in playlists:
+            if self._playlists.pop(key, None) is not None:
+                authors.add(key[0])
+        # filter playlists of every author once
+        for author in authors:
+            a = self._authors[author]
+            a['playlists'] = [pl for pl in a['playlists']
+                              if (author, pl.title) in self._playlists]
+            if not a['playlists']:
+                del self._authors[author]
+        return bool(authors)
+
+    def query(self, author=None, title=None, profile=None, out_format=None,
+              stale_since=None, has_failures=None):
+        '''yield playlists saved in the DB as dictionaries
+        one by one without loading all of them;
+        title is a pattern with * and ?, stale_since is a time
+        the playlists have not been updated since'''
+        conditions, params = [], []
+        if author is not None:
+            conditions.append('author.name = ?')
+            params.append(author)
+        if title is not None:
+            conditions.append('playlist.title GLOB ?')
+            params.append(title)
+        if profile is not None:
+            # profiles is a JSON list, look for the quoted name
+            conditions.append('instr(playlist.profiles, ?) > 0')
+            params.append(json.dumps(profile))
+        if out_format is not None:
+            conditions.append('playlist.out_format = ?')
+            params.append(OutputFormatType.to_char(out_format))
+        if stale_since is not None:
+            conditions.append('playlist.last_update < ?')
+            params.append(stale_since)
+        if has_failures is not None:
+            conditions.append(('' if has_failures else 'NOT ') +
+                              'EXISTS (SELECT 1 FROM failed_entity '
+                              'WHERE playlist_id = playlist.id)')
+        where = f"WHERE {' AND '.join(conditions)} " if conditions else ''
+        with self._transaction() as db:
+            cursor = db.execute(
+                'SELECT author.name, playlist.title, playlist.url, '
+                'playlist.out_format, playlist.profiles, '
+                'playlist.last_update, playlist.last_fetch, '
+                '(SELECT COUNT(*) FROM failed_entity '
+                'WHERE playlist_id = playlist.id) '
+                'FROM playlist JOIN author '
+                f'ON author.id = playlist.author_id {where}'
+                'ORDER BY author.id, playlist.id', params)
+            for (a, t, url, out_format, profiles, last_update,
+                 last_fetch, failed) in cursor:
+                yield {'author': a,
+                       'title': t,
+                       'url': url,
+                       'out_format': out_format,
+                       'profiles': json.loads(profiles),
+                       'last_update': last_update,
+                       'last_fetch': last_fetch,
+                       'failed': failed}
+
+    def iter_authors(self):
+        '''yield (ID, name) of authors saved in the DB'''
+        with self._transaction() as db:
+            yield from db.execute('SELECT id, name FROM author ORDER BY id')
+
+    def iter_playlists(self):
+        '''yield (ID, author ID, playlist) of playlists saved in the DB
+        one by one; failed entities are not loaded'''
+        columns = ', '.join(Feeds.COLUMNS)
+        with self._transaction() as db:
+            for pl_id, author_id, title, *row in db.execute(
+                    f'SELECT id, author_id, title, {columns} '
+                    'FROM playlist ORDER BY id'):
+                yield pl_id, author_id, Feeds._make_playlist(title, row)
+
+    def iter_failed_entities(self):
+        '''yield (playlist ID, profile, entity) of all failed entities
+        saved in the DB one by one'''
+        with self._transaction() as db:
+            for pl_id, p, e in db.execute('SELECT playlist_id, profile, '
+                                          'entity FROM failed_entity '
+                                          'ORDER BY id'):
+                yield pl_id, p, Entity.from_dict(json.loads(e))
+
+    def backup(self, file):
+        '''write playlists saved in the DB with their failed entities
+        to the text file, a JSON object per line;
+        return the number of playlists'''
+        count = 0
+        columns = ', '.join(f'playlist.{c}' for c in Feeds.COLUMNS)
+        with self._transaction() as db:
+            # read both tables in the same order and merge them
+            failed = db.execute('SELECT playlist.author_id, playlist_id, '
+                                'profile, entity FROM failed_entity '
+                                'JOIN playlist '
+                                'ON playlist.id = failed_entity.playlist_id '
+                                'ORDER BY playlist.author_id, playlist_id, '
+                                'failed_entity.id')
+            next_failed = next(failed, None)
+            for author_id, pl_id, author, title, *row in db.execute(
+                    'SELECT author.id, playlist.id, author.name, '
+                    f'playlist.title, {columns} FROM playlist JOIN author '
+                    'ON author.id = playlist.author_id '
+                    'ORDER BY author.id, playlist.id'):
+                record = {'author': author, 'title': title,
+                          **dict(zip(Feeds.COLUMNS, row))}
+                record['profiles'] = json.loads(record['profiles'])
+                record['publish_times'] = \
+                    json.loads(record['publish_times'])
+                failed_entities = {}
+                while next_failed is not None \
+                        and tuple(next_failed[:2]) <= (author_id, pl_id):
+                    if next_failed[1] == pl_id:
+                        failed_entities.setdefault(next_failed[2], []) \
+                            .append(json.loads(next_failed[3]))
+                    next_failed = next(failed, None)
+                record['failed_entities'] = failed_entities
+                file.write(json.dumps(record, ensure_ascii=False) + '\n')
+                count += 1
+        return count
+
+    def restore(self, file):
+        '''add playlists from the text file made by backup,
+        playlists with the same author and title are replaced;
+        return the number of playlists'''
+        count = 0
+        authors = {}
+        lines = iter(file)
+        with self._transaction(write=True) as db:
+            pl_id = db.execute('SELECT COALESCE(MAX(id), 0) '
+                               'FROM playlist').fetchone()[0]
+            columns = ', '.join(Feeds.COLUMNS)
+            params = ', '.join('?' * len(Feeds.COLUMNS))
+            while True:
+                batch = [json.loads(ln) for ln in
+                         itertools.islice(lines, Feeds.BATCH_SIZE)
+                         if ln.strip()]
+                if not batch:
+                    break
+                # the last one of the same playlist wins as in other batches
+                batch = list({(r['author'], r['title']): r
+                              for r in batch}.values())
+                playlists, failed = [], []
+                for r in batch:
+                    author_id = authors.get(r['author'])
+                    if author_id is None:
+                        db.execute('INSERT OR IGNORE INTO author(name) '
+                                   'VALUES (?)', (r['author'],))
+                        author_id = authors[r['author']] = db.execute(
+                            'SELECT id FROM author WHERE name = ?',
+                            (r['author'],)).fetchone()[0]
+                    pl_id += 1
+                    r['profiles'] = json.dumps(r['profiles'])
+                    r['publish_times'] = json.dumps(r['publish_times'])
+                    playlists.append((pl_id, author_id, r['title']) +
+                                     tuple(r[c] for c in Feeds.COLUMNS))
+                    failed.extend((pl_id, p, json.dumps(e))
+                                  for p, es in r['failed_entities'].items()
+                                  for e in es)
+                db.executemany('DELETE FROM playlist '
+                               'WHERE author_id = ? AND title = ?',
+                               [pl[1:3] for pl in playlists])
+                db.executemany('INSERT INTO playlist(id, author_id, title, '
+                               f'{columns}) VALUES (?, ?, ?, {params})',
+                               playlists)
+                db.executemany('INSERT INTO failed_entity(playlist_id, '
+                               'profile, entity) VALUES (?, ?, ?)', failed)
+                count += len(batch)
+        # the DB has been changed behind the loaded playlists
+        self._pulled = False
+        self._ids = {}
+        return count
 
     def _pull(self):
-        'pull data from the DB'
-        db = self._create_ro_connector()
-        if db:
-            raw_feeds = db.get('feeds', [])
-            for author in raw_feeds:
-                pls = []
-                for raw_pl in author['playlists']:
-                    pl = Playlist(raw_pl['title'], raw_pl['url'])
-                    pl.last_update = raw_pl['last_update']
-                    pl.set_output_format_type(raw_pl['out_format'])
-                    pl.profiles = raw_pl['profiles']
-                    pl.add_failed_entities(raw_pl.get('failed_entities', {}))
-                    pls.append(pl)
-                self._feeds.append({'author': author['author'],
-                                    'playlists': pls})
-            self._close(db)
-
-    def _push(self):
-        'push data to the db'
-        db = self._create_rw_connector()
-        res = []
-        for author in self._feeds:
-            o = {'author': author['author'], 'playlists': []}
-            for ls in author['playlists']:
-                o['playlists'].append(
-                    {'title': ls.title,
-                     'url': ls.url,
-                     'last_update': ls.last_update,
-                     'out_format': ls.output_format,
-                     'profiles': ls.profiles,
-                     'failed_entities': ls.failed_entities})
-            res.append(o)
-        db['feeds'] = res
-        self._close(db)
-
-    def _create_rw_connector(self):
-        '''create DB connector in read/write mode'''
-        return shelve.open(self.db_file, flag='c', writeback=False)
-
-    def _create_ro_connector(self):
-        '''create DB connector in read-only mode'''
+        '''pull playlists from the DB;
+        only the number of failed entities is read,
+        they are loaded when they are accessed'''
+        with self._transaction() as db:
+            columns = ', '.join(f'playlist.{c}' for c in Feeds.COLUMNS)
+            self._authors = {}
+            self._playlists = {}
+            for author, title, pl_id, failed_count, *row in db.execute(
+                    f'SELECT author.name, playlist.title, playlist.id, '
+                    '(SELECT COUNT(*) FROM failed_entity '
+                    'WHERE playlist_id = playlist.id), '
+                    f'{columns} FROM playlist JOIN author '
+                    'ON author.id = playlist.author_id '
+                    'ORDER BY author.id, playlist.id'):
+                pl = Feeds._make_playlist(title, row)
+                pl.set_failed_loader(failed_count,
+                                     functools.partial(self._load_failed,
+                                                       pl_id))
+                self._ids[(author, title)] = pl_id
+                self._index_playlist(author, pl)
+        self._pulled = True
+
+    def _load_failed(self, pl_id):
+        '''load failed entities of the playlist as profile -> entities'''
+        failed = {}
+        with self._transaction() as db:
+            for p, e in db.execute('SELECT profile, entity FROM failed_entity '
+                                   'WHERE playlist_id = ? ORDER BY id',
+                                   (pl_id,)):
+                failed.setdefault(p, []).append(
+                    Entity.from_dict(json.loads(e)))
+        return failed
+
+    @contextlib.contextmanager
+    def _transaction(self, write=False):
+        '''connect to the DB, create or migrate it if needed;
+        the changes are committed at once.
+        Other processes can read the DB while it is written;
+        a write transaction locks the DB for writing from its start,
+        so whatever it reads is not changed by others until the commit;
+        other writers wait for it up to LOCK_TIMEOUT seconds.'''
+        # transactions are begun explicitly, not before the first change
+        db = sqlite3.connect(self.db_file, timeout=Feeds.LOCK_TIMEOUT,
+                             isolation_level=None)
         try:
-            return shelve.open(self.db_file, flag='r')
-        except dbm.error:
-            return None
+            db.execute('PRAGMA foreign_keys = ON')
+            if db.execute('PRAGMA user_version').fetchone()[0] \
+                    < Feeds.SCHEMA_VERSION:
+                self._migrate(db)
+            db.execute('BEGIN IMMEDIATE' if write else 'BEGIN')
+            try:
+                yield db
+            except BaseException:
+                db.rollback()
+                raise
+            db.commit()
+        finally:
+            db.close()
 
-    def _close(self, db):
+    def _migrate(self, db):
+        '''create or migrate the DB'''
+        db.execute('PRAGMA journal_mode = WAL')
+        db.execute('BEGIN IMMEDIATE')
+        # another process might have done it while this one was waiting
+        version = db.execute('PRAGMA user_version').fetchone()[0]
+        if version < Feeds.SCHEMA_VERSION:
+            # executescript() would commit the transaction
+            for statement in Feeds.SCHEMA.split(';'):
+                db.execute(statement)
+            self._migrate_shelve(db)
+            db.execute(f'PRAGMA user_version = {Feeds.SCHEMA_VERSION}')
+        db.commit()
+
+    def _migrate_shelve(self, db):
+        '''copy playlists from the shelve DB of older versions'''
+        if not glob.glob(glob.escape(self.shelve_db_file) + '*'):
+            return
         try:
-            db.close()
-        except ValueError as e:
-            print('Probably your changes were lost. Try again')
-            raise e
+            with shelve.open(self.shelve_db_file, flag='r') as sh:
+                raw_feeds = sh.get('feeds', [])
+        except dbm.error:
+            return
+        for author in raw_feeds:
+            for raw_pl in author['playlists']:
+                pl = Playlist(raw_pl['title'], raw_pl['url'])
+                pl.last_update = raw_pl['last_update']
+                pl.set_output_format_type(raw_pl['out_format'])
+                pl.profiles = raw_pl['profiles']
+                pl.add_failed_entities(
+                    {p: [Entity.from_entry(e) for e in es]
+                     for p, es in raw_pl.get('failed_entities', {}).items()})
+                pl.etag = raw_pl.get('etag')
+                pl.last_modified = raw_pl.get('last_modified')
+                pl.set_fetch_failures(raw_pl.get('fetch_failures', 0),
+                                      raw_pl.get('last_fetch_failure', 0))
+                pl.last_fetch = raw_pl.get('last_fetch', 0)
+                pl.add_publish_times(raw_pl.get('publish_times', []))
+                Feeds._insert_playlist(db, author['author'], pl.title, pl)
+
+    @staticmethod
+    def _insert_playlist(db, author, title, pl):
+        '''insert the playlist and its author if it is new'''
+        db.execute('INSERT OR IGNORE INTO author(name) VALUES (?)',
+                   (author,))
+        author_id = db.execute('SELECT id FROM author WHERE name = ?',
+                               (author,)).fetchone()[0]
+        columns = ', '.join(Feeds.COLUMNS)
+        params = ', '.join('?' * len(Feeds.COLUMNS))
+        pl_id = db.execute(f'INSERT INTO playlist(author_id, title, '
+                           f'{columns}) VALUES (?, ?, {params})',
+                           (author_id, title) + Feeds._get_row(pl)).lastrowid
+        Feeds._replace_failed(db, pl_id, Feeds._get_failed_rows(pl))
+        return pl_id
+
+    @staticmethod
+    def _update_playlist(db, pl_id, pl):
+        '''update changed fields of the playlist;
+        return False if it has been removed by another process'''
+        row = dict(zip(Feeds.COLUMNS, Feeds._get_row(pl)))
+        columns = [c for c in Feeds.COLUMNS if c in pl.dirty]
+        if not db.execute('SELECT 1 FROM playlist WHERE id = ?',
+                          (pl_id,)).fetchone():
+            return False
+        if columns:
+            assignments = ', '.join(f'{c} = ?' for c in columns)
+            db.execute(f'UPDATE playlist SET {assignments} WHERE id = ?',
+                       [row[c] for c in columns] + [pl_id])
+        if 'failed_entities' in pl.dirty:
+            Feeds._replace_failed(db, pl_id, Feeds._get_failed_rows(pl))
+        return True
+
+    @staticmethod
+    def _replace_failed(db, pl_id, failed):
+        '''replace failed entities of the playlist'''
+        db.execute('DELETE FROM failed_entity WHERE playlist_id = ?',
+                   (pl_id,))
+        db.executemany('INSERT INTO failed_entity(playlist_id, profile, '
+                       'entity) VALUES (?, ?, ?)',
+                       [(pl_id, p, e) for p, e in failed])
+
+    @staticmethod
+    def _get_row(pl):
+        '''get values of the playlist in the order of COLUMNS'''
+        return (pl.url,
+                OutputFormatType.to_char(pl.output_format),
+                json.dumps(pl.profiles),
+                pl.last_update,
+                pl.etag,
+                pl.last_modified,
+                pl.fetch_failures,
+                pl.last_fetch_failure,
+                pl.last_fetch,
+                json.dumps(pl.publish_times))
+
+    @staticmethod
+    def _get_failed_rows(pl):
+        '''get failed entities of the playlist as (profile, JSON)'''
+        return [(p, json.dumps(e.to_dict()))
+                for p, es in pl.failed_entities.items() for e in es]
+
+    @staticmethod
+    def _make_playlist(title, row):
+        '''make the playlist from values in the order of COLUMNS'''
+        (url, out_format, profiles, last_update, etag, last_modified,
+         fetch_failures, last_fetch_failure, last_fetch, publish_times) = row
+        pl = Playlist(title, url)
+        pl.set_output_format_type(out_format)
+        pl.profiles = json.loads(profiles)
+        pl.last_update = last_update
+        pl.etag = etag
+        pl.last_modified = last_modified
+        pl.set_fetch_failures(fetch_failures, last_fetch_failure)
+        pl.last_fetch = last_fetch
+        pl.add_publish_times(json.loads(publish_times))
+        pl.clean()
+        return pl
 
 
 class SqlExporter(object):
-    '''Export the DB to SQL'''
+    '''Export the DB to SQL or to an SQLite3 database;
+    rows are read and written in batches, so the memory does not grow
+    with the size of the DB'''
 
     DB_NAME = 'bluetube'
     ENGINE = ''
-    ID_INT = 'id INTEGER PRIMARY KEY,'
+    ID_INT = 'id INTEGER PRIMARY KEY'
+    BATCH_SIZE = 500
 
     def __init__(self, feeds):
         self._feeds = feeds
 
     def export(self, file):
-        '''export DB'''
+        '''export DB as SQL statements to the text file'''
         file.write(self._add_header())
         file.write(self._create_roles())
         file.write(self._create_users())
         file.write(self._create_authors())
         file.write(self._create_playlists())
-        file.write(self._insert_authors_and_playlists())
+        file.write(self._create_failed_entities())
+        for table, columns, rows in self._get_tables():
+            for batch in SqlExporter._get_batches(rows):
+                values = ',\n'.join(map(SqlExporter._get_values, batch))
+                file.write(f"\nINSERT INTO {table}({', '.join(columns)})\n"
+                           f'VALUES {values};\n')
+
+    def export_db(self, path):
+        '''export DB to the SQLite3 database file;
+        the file is replaced when the export is done'''
+        tmp = path + '.tmp'
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        db = sqlite3.connect(tmp)
+        try:
+            db.executescript(self._create_roles() +
+                             self._create_users() +
+                             self._create_authors() +
+                             self._create_playlists() +
+                             self._create_failed_entities())
+            with db:
+                for table, columns, rows in self._get_tables():
+                    params = ', '.join('?' * len(columns))
+                    sql = (f"INSERT INTO {table}({', '.join(columns)}) "
+                           f'VALUES ({params})')
+                    for batch in SqlExporter._get_batches(rows):
+                        db.executemany(sql, batch)
+        finally:
+            db.close()
+        os.replace(tmp, path)
+
+    def _get_tables(self):
+        '''yield (table, columns, rows) for every table;
+        authors and playlists keep their IDs, so no look-ups are needed'''
+        yield 'role', ('id', 'role'), [(1, 'admin'), (2, 'user')]
+        yield ('user', ('id', 'name', 'password', 'email', 'role_id'),
+               [(1, 'admin', 'admin', 'email@example.com', 1)])
+        yield ('author', ('id', 'name', 'user_id'),
+               ((a_id, name, 1) for a_id, name in self._feeds.iter_authors()))
+        yield ('playlist', ('id', 'title', 'URL', 'out_format', 'profiles',
+                            'last_update', 'etag', 'last_modified',
+                            'fetch_failures', 'last_fetch_failure',
+                            'last_fetch', 'publish_times', 'author_id'),
+               self._get_playlist_rows())
+        yield ('failed_entity', ('playlist_id', 'profile', 'video_id', 'URL',
+                                 'title', 'author', 'published', 'summary'),
+               ((pl_id, profile, e.yt_videoid, e.link, e.title, e.author,
+                 SqlExporter._to_timestamp(e.published), e.summary)
+                for pl_id, profile, e in self._feeds.iter_failed_entities()))
+
+    def _get_playlist_rows(self):
+        for pl_id, author_id, pl in self._feeds.iter_playlists():
+            nf = 'mp3' if pl.output_format is OutputFormatType.audio \
+                else 'mp4'
+            yield (pl_id, pl.title, pl.url, nf, json.dumps(pl.profiles),
+                   SqlExporter._to_timestamp(pl.last_update),
+                   pl.etag, pl.last_modified, pl.fetch_failures,
+                   SqlExporter._to_timestamp(pl.last_fetch_failure),
+                   SqlExporter._to_timestamp(pl.last_fetch),
+                   json.dumps(pl.publish_times), author_id)
+
+    @staticmethod
+    def _get_batches(rows):
+        '''split rows into lists of BATCH_SIZE'''
+        rows = iter(rows)
+        while True:
+            batch = list(itertools.islice(rows, SqlExporter.BATCH_SIZE))
+            if not batch:
+                return
+            yield batch
+
+    @staticmethod
+    def _to_timestamp(t):
+        '''convert the time to a TIMESTAMP value in UTC'''
+        if not t:
+            return None
+        return datetime.datetime.fromtimestamp(t, datetime.timezone.utc) \
+            .strftime('%Y-%m-%d %H:%M:%S')
+
+    @staticmethod
+    def _get_values(row):
+        '''make a list of SQL literals of the row'''
+        return '(' + ', '.join(map(SqlExporter._quote, row)) + ')'
+
+    @staticmethod
+    def _quote(value):
+        '''make an SQL literal of the value'''
+        if value is None:
+            return 'NULL'
+        if isinstance(value, (int, float)):
+            return repr(value)
+        return "'" + str(value).replace("'", "''") + "'"
 
     def _add_header(self):
         return f'/*\nBluetube {__version__} DB for SQLite3.\n*/\n\n'
@@ -191,13 +676,10 @@ class SqlExporter(object):
     def _create_roles(self):
         r = ['']
         r.append('CREATE TABLE IF NOT EXISTS role(')
-        r.append('    id TINYINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,')
+        r.append('    id TINYINT UNSIGNED PRIMARY KEY,')
         r.append('    role CHAR(10) NOT NULL UNIQUE')
         r.append(f') {SqlExporter.ENGINE};')
         r.append('')
-        r.append('INSERT INTO role(id, role)')
-        r.append("VALUES (1, 'admin'), (2, 'user');")
-        r.append('')
         return '\n'.join(r)
 
     def _create_users(self):
@@ -209,12 +691,9 @@ class SqlExporter(object):
         r.append('    email VARCHAR(100),')
         r.append('    role_id TINYINT UNSIGNED NOT NULL,')
         r.append('    created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,')
-        r.append('    FOREIGN KEY(role_id) REFERENCES roles(id)')
+        r.append('    FOREIGN KEY(role_id) REFERENCES role(id)')
         r.append(f') {SqlExporter.ENGINE};')
         r.append('')
-        r.append('INSERT INTO user(id, name, password, email, role_id)')
-        r.append("VALUES (1, 'admin', 'admin', 'email@example.com', 1);")
-        r.append('')
         return '\n'.join(r)
 
     def _create_authors(self):
@@ -223,7 +702,7 @@ class SqlExporter(object):
         r.append(f'    {SqlExporter.ID_INT},')
         r.append('    name VARCHAR(255) UNIQUE,')
         r.append('    user_id INT UNSIGNED NOT NULL,')
-        r.append('    FOREIGN KEY(user_id) REFERENCES users(id)' +
+        r.append('    FOREIGN KEY(user_id) REFERENCES user(id)' +
                  ' ON UPDATE CASCADE ON DELETE CASCADE')
         r.append(f') {SqlExporter.ENGINE};')
         r.append('')
@@ -236,30 +715,36 @@ class SqlExporter(object):
         r.append('    title VARCHAR(255) NOT NULL,')
         r.append('    URL VARCHAR(2048) NOT NULL,')
         r.append('    out_format CHAR(3) NOT NULL,')
+        r.append('    profiles VARCHAR(1024) NOT NULL,')
         r.append('    last_update TIMESTAMP,')
+        r.append('    etag VARCHAR(255),')
+        r.append('    last_modified VARCHAR(64),')
+        r.append('    fetch_failures INT UNSIGNED NOT NULL DEFAULT 0,')
+        r.append('    last_fetch_failure TIMESTAMP,')
+        r.append('    last_fetch TIMESTAMP,')
+        r.append('    publish_times TEXT NOT NULL,')
         r.append('    author_id INT UNSIGNED NOT NULL,')
         r.append('    UNIQUE(title, author_id),')
-        r.append('    FOREIGN KEY(author_id) REFERENCES authors(id)' +
-                 'ON UPDATE CASCADE ON DELETE CASCADE')
+        r.append('    FOREIGN KEY(author_id) REFERENCES author(id)' +
+                 ' ON UPDATE CASCADE ON DELETE CASCADE')
         r.append(f') {SqlExporter.ENGINE};')
         r.append('')
         return '\n'.join(r)
 
-    def _insert_authors_and_playlists(self):
-        r = []
-        for x in self._feeds:
-            r.append('')
-            author = x['author'].replace("'", "''")
-            r.append("INSERT INTO author(name, user_id)")
-            r.append(f"VALUES ('{author}', 1);")
-            for y in x['playlists']:
-                r.append('\n')
-                r.append('INSERT INTO playlist' +
-                         '(title, URL, out_format, author_id)')
-                a = OutputFormatType.audio
-                nf = 'mp3' if y.output_format is a else 'mp4'
-                title = y.title.replace("'", "''")
-                sub = f"(SELECT id FROM author WHERE name = '{author}')"
-                r.append(f"VALUES ('{title}', '{y.url}', '{nf}', {sub} );")
+    def _create_failed_entities(self):
+        r = ['']
+        r.append('CREATE TABLE IF NOT EXISTS failed_entity(')
+        r.append(f'    {SqlExporter.ID_INT},')
+        r.append('    playlist_id INT UNSIGNED NOT NULL,')
+        r.append('    profile VARCHAR(100) NOT NULL,')
+        r.append('    video_id VARCHAR(20),')
+        r.append('    URL VARCHAR(2048) NOT NULL,')
+        r.append('    title VARCHAR(255) NOT NULL,')
+        r.append('    author VARCHAR(255),')
+        r.append('    published TIMESTAMP,')
+        r.append('    summary TEXT,')
+        r.append('    FOREIGN KEY(playlist_id) REFERENCES playlist(id)' +
+                 ' ON UPDATE CASCADE ON DELETE CASCADE')
+        r.append(f') {SqlExporter.ENGINE};')
         r.append('')
         return '\n'.join(r)
@@ -17,6 +17,7 @@
 
 '''
 
+import time
 from enum import Enum, unique
 
 
@@ -54,11 +55,110 @@ class OutputFormatType(Enum):
             assert 0, 'unknown type'
 
 
+class Entity(object):
+    '''
+    Represents a video of a playlist with the data
+    needed to download it and to add metadata to the file.
+    It is immutable, so it is shared by all profiles.
+    '''
+
+    __slots__ = ('yt_videoid', 'link', 'title', 'author',
+                 'published', 'summary')
+
+    # the summary is shown to the user and put to tags, no need to keep more
+    MAX_SUMMARY = 1024
+
+    def __init__(self, yt_videoid, link, title, author='',
+                 published=0, summary=''):
+        for f, v in zip(Entity.__slots__,
+                        (yt_videoid, link, title, author, published,
+                         summary[:Entity.MAX_SUMMARY])):
+            object.__setattr__(self, f, v)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'{type(self).__name__} is immutable')
+
+    def __reduce__(self):
+        return (Entity, tuple(getattr(self, f) for f in Entity.__slots__))
+
+    @staticmethod
+    def from_entry(entry):
+        '''make an entity from a feed entry'''
+        published = entry.get('published_parsed')
+        return Entity(entry.get('yt_videoid'),
+                      entry.get('link'),
+                      entry.get('title') or '',
+                      entry.get('author') or '',
+                      time.mktime(published) if published else 0,
+                      entry.get('summary') or '')
+
+    @staticmethod
+    def from_dict(d):
+        '''make an entity from a dictionary made by to_dict'''
+        return Entity(**d)
+
+    def to_dict(self):
+        '''get all fields as a dictionary'''
+        return {f: getattr(self, f) for f in Entity.__slots__}
+
+    def __eq__(self, other):
+        if not isinstance(other, Entity):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    def __hash__(self):
+        return hash(tuple(self.to_dict().values()))
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.yt_videoid!r}, {self.link!r})'
+
+
+class DownloadInfo(object):
+    '''
+    Describes a downloaded file, the fields the downloader
+    does not know are None.
+    '''
+
+    __slots__ = ('filename', 'format', 'size', 'duration')
+
+    def __init__(self, filename, format=None, size=None, duration=None):
+        self.filename = filename
+        self.format = format
+        self.size = size
+        self.duration = duration
+
+    def __repr__(self):
+        return (f'{type(self).__name__}({self.filename!r}, {self.format!r}, '
+                f'{self.size!r}, {self.duration!r})')
+
+
+class WorkItem(object):
+    '''
+    Represents an entity being processed for a profile.
+    The link is the URL of the video at first,
+    then the name of the downloaded or converted file.
+    The info describes the downloaded file.
+    '''
+
+    __slots__ = ('entity', 'link', 'info')
+
+    def __init__(self, entity):
+        self.entity = entity
+        self.link = entity.link
+        self.info = None
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.entity!r}, {self.link!r})'
+
+
 class Playlist(object):
     '''
     Represents a playlist or channel.
     '''
 
+    # keep so many latest publish times to estimate the cadence
+    MAX_PUBLISH_TIMES = 20
+
     def __init__(self, title, url):
         self.author = None
         self._title = title
@@ -68,7 +168,27 @@ class Playlist(object):
         self._profiles = []
         self._feedparser_data = None
         self._failed_entities = {}
+        # loads failed entities when they are needed, see set_failed_loader
+        self._failed_loader = None
+        self._failed_count = 0
         self._entities = []
+        self._etag = None
+        self._last_modified = None
+        self._fetch_failures = 0
+        self._last_fetch_failure = 0
+        self._last_fetch = 0
+        self._publish_times = []
+        # names of fields changed since the playlist has been saved
+        self._dirty = set()
+
+    @property
+    def dirty(self):
+        '''names of fields changed since the playlist has been saved'''
+        return frozenset(self._dirty)
+
+    def clean(self):
+        '''the playlist has been saved'''
+        self._dirty.clear()
 
     def set_output_format_type(self, output_format_type):
         if isinstance(output_format_type, str):
@@ -76,7 +196,7 @@ class Playlist(object):
                  'video': OutputFormatType.video}[output_format_type]
         else:
             t = output_format_type
-        self._output_format = t
+        self.output_format = t
 
     @property
     def feedparser_data(self):
@@ -104,7 +224,86 @@ class Playlist(object):
 
     @last_update.setter
     def last_update(self, lu):
-        self._last_update = lu
+        if lu != self._last_update:
+            self._last_update = lu
+            self._dirty.add('last_update')
+
+    @property
+    def etag(self):
+        '''the ETag validator of the last fetched feed'''
+        return self._etag
+
+    @etag.setter
+    def etag(self, etag):
+        if etag != self._etag:
+            self._etag = etag
+            self._dirty.add('etag')
+
+    @property
+    def last_modified(self):
+        '''the Last-Modified validator of the last fetched feed'''
+        return self._last_modified
+
+    @last_modified.setter
+    def last_modified(self, lm):
+        if lm != self._last_modified:
+            self._last_modified = lm
+            self._dirty.add('last_modified')
+
+    def reset_validators(self):
+        '''forget HTTP validators to fetch the whole feed next time'''
+        self.etag = None
+        self.last_modified = None
+
+    @property
+    def fetch_failures(self):
+        '''the number of runs the feed failed to be fetched in a row'''
+        return self._fetch_failures
+
+    @property
+    def last_fetch_failure(self):
+        '''the time of the last failed attempt to fetch the feed'''
+        return self._last_fetch_failure
+
+    def set_fetch_failed(self, when):
+        '''register a failed attempt to fetch the feed'''
+        self.set_fetch_failures(self._fetch_failures + 1, when)
+
+    def set_fetch_failures(self, failures, last_failure):
+        '''restore the failed attempts to fetch the feed'''
+        if (failures, last_failure) != (self._fetch_failures,
+                                        self._last_fetch_failure):
+            self._fetch_failures = failures
+            self._last_fetch_failure = last_failure
+            self._dirty.update(('fetch_failures', 'last_fetch_failure'))
+
+    def reset_fetch_failures(self):
+        '''the feed has been fetched successfully'''
+        self.set_fetch_failures(0, 0)
+
+    @property
+    def last_fetch(self):
+        '''the time of the last successful fetch of the feed'''
+        return self._last_fetch
+
+    @last_fetch.setter
+    def last_fetch(self, lf):
+        if lf != self._last_fetch:
+            self._last_fetch = lf
+            self._dirty.add('last_fetch')
+
+    @property
+    def publish_times(self):
+        '''the latest publish times of entries, sorted'''
+        return self._publish_times
+
+    def add_publish_times(self, times):
+        '''merge publish times of entries'''
+        merged = sorted(set(self._publish_times).union(times))
+        merged = merged[-Playlist.MAX_PUBLISH_TIMES:]
+        if merged != self._publish_times:
+            self._publish_times = merged
+            self._dirty.add('publish_times')
 
     @property
     def output_format(self):
@@ -112,7 +311,9 @@ class Playlist(object):
 
     @output_format.setter
     def output_format(self, output_format):
-        self._output_format = output_format
+        if output_format is not self._output_format:
+            self._output_format = output_format
+            self._dirty.add('out_format')
 
     @property
     def profiles(self):
@@ -120,7 +321,9 @@ class Playlist(object):
 
     @profiles.setter
     def profiles(self, p):
-        self._profiles = p
+        if p != self._profiles:
+            self._profiles = p
+            self._dirty.add('profiles')
 
     @property
     def entities(self):
@@ -136,16 +339,50 @@ class Playlist(object):
 
     @property
     def failed_entities(self):
+        self._load_failed_entities()
         return self._failed_entities
 
+    @property
+    def failed_count(self):
+        '''the number of failed entities, they are not loaded for this'''
+        if self._failed_loader is not None:
+            return self._failed_count
+        return sum(len(es) for es in self._failed_entities.values())
+
+    def set_failed_loader(self, count, loader):
+        '''set the function that loads count failed entities
+        when they are accessed the first time'''
+        self._failed_entities = {}
+        self._failed_count = count
+        self._failed_loader = loader if count else None
+
+    def _load_failed_entities(self):
+        if self._failed_loader is not None:
+            self._failed_entities = self._failed_loader()
+            self._failed_loader = None
+
     def add_failed_entities(self, fl):
+        self._load_failed_entities()
         for p in fl:
             if len(fl[p]):
                 self._failed_entities.setdefault(p, []).extend(fl[p])
+                self._dirty.add('failed_entities')
+
+    def pop_failed_entities(self, profile):
+        '''remove failed entities of the profile and return them'''
+        self._load_failed_entities()
+        if profile not in self._failed_entities:
+            return []
+        self._dirty.add('failed_entities')
+        return self._failed_entities.pop(profile)
 
     @failed_entities.deleter
     def failed_entities(self):
-        self._failed_entities.clear()
+        if self.failed_count:
+            # no need to load them
+            self._failed_loader = None
+            self._failed_entities = {}
+            self._dirty.add('failed_entities')
 
     def __str__(self):
         return f'{type(self).__name__}: {self.author} - {self._title}'
@@ -0,0 +1,33 @@
+'''
+Import and export of subscriptions in OPML.
+'''
+
+from xml.etree import ElementTree
+
+
+def read_opml(file):
+    '''read URLs of feeds from the OPML file,
+    outlines might be nested e.g. in the YouTube export'''
+    # a dict keeps the order and drops duplicates
+    urls = dict.fromkeys(outline.get('xmlUrl') for outline
+                         in ElementTree.parse(file).iter('outline'))
+    return [url for url in urls if url]
+
+
+def write_opml(file, feeds, title='Bluetube subscriptions'):
+    '''write the feeds to the OPML file,
+    playlists are grouped by authors'''
+    opml = ElementTree.Element('opml', version='1.0')
+    head = ElementTree.SubElement(opml, 'head')
+    ElementTree.SubElement(head, 'title').text = title
+    body = ElementTree.SubElement(opml, 'body')
+    for a in feeds:
+        author = ElementTree.SubElement(body, 'outline',
+                                        text=a['author'], title=a['author'])
+        for pl in a['playlists']:
+            ElementTree.SubElement(author, 'outline',
+                                   text=pl.title, title=pl.title,
+                                   type='rss', xmlUrl=pl.url)
+    tree = ElementTree.ElementTree(opml)
+    ElementTree.indent(tree)
+    tree.write(file, encoding='utf-8', xml_declaration=True)
@@ -80,6 +80,12 @@ class Profiles(object):
             return self._profiles[profile].get('video', {})
         return None
 
+    def get_download_options(self, profile):
+        '''get options of the downloader e.g. concurrency'''
+        if profile in self._profiles:
+            return self._profiles[profile].get('download', {})
+        return None
+
     def get_convert_options(self, profile):
         if profile in self._profiles:
             return self._profiles[profile].get('convert')
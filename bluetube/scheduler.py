@@ -0,0 +1,54 @@
+'''
+The scheduler of feeds.
+'''
+
+import statistics
+
+from bluetube.model import Playlist
+
+
+class Scheduler(object):
+    '''
+    Decides which playlists should be fetched in this run.
+
+    A feed is fetched as often as its channel publishes:
+    the poll interval is a fraction of the median interval
+    between the latest publications, but not more than a day.
+    '''
+
+    # a feed that failed is not probed again during this time,
+    # the delay doubles every failed run
+    FAILURE_DELAY = 15 * 60
+    MAX_FAILURE_DELAY = 24 * 60 * 60
+
+    # the number of publications needed to estimate the cadence
+    MIN_PUBLISH_TIMES = 3
+    POLL_FRACTION = 0.1
+    MAX_POLL_INTERVAL = 24 * 60 * 60
+
+    def __init__(self, full: bool = False) -> None:
+        self._full = full
+
+    def is_due(self, pl: Playlist, now: float) -> bool:
+        '''check if the playlist should be fetched now'''
+        if self._full:
+            return True
+        if pl.fetch_failures:
+            delay = min(Scheduler.FAILURE_DELAY *
+                        2 ** (pl.fetch_failures - 1),
+                        Scheduler.MAX_FAILURE_DELAY)
+            return pl.last_fetch_failure + delay <= now
+        return self.get_next_fetch(pl) <= now
+
+    def get_next_fetch(self, pl: Playlist) -> float:
+        '''get the time the playlist is expected to have updates'''
+        return pl.last_fetch + self.get_poll_interval(pl)
+
+    def get_poll_interval(self, pl: Playlist) -> float:
+        '''estimate how often the playlist should be fetched'''
+        times = pl.publish_times
+        if len(times) < Scheduler.MIN_PUBLISH_TIMES:
+            return 0
+        intervals = [b - a for a, b in zip(times, times[1:])]
+        interval = statistics.median(intervals) * Scheduler.POLL_FRACTION
+        return min(interval, Scheduler.MAX_POLL_INTERVAL)
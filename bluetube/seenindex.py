@@ -0,0 +1,67 @@
+'''
+The index of processed videos.
+'''
+
+import os
+import sqlite3
+import time
+
+
+class SeenIndex(object):
+    '''
+    Keeps IDs of processed videos with their outcome, the time
+    and the playlist they have been processed in.
+    The index is an SQLite DB, so a lookup does not load the whole index
+    and several processes may add to it at the same time.
+    '''
+
+    DBFILENAME = 'seen.sqlite3'
+    LOCK_TIMEOUT = 60
+
+    ACCEPTED = 'accepted'
+    REJECTED = 'rejected'
+    DOWNLOADED = 'downloaded'
+    FAILED = 'failed'
+
+    def __init__(self, db_dir):
+        self.db_file = os.path.join(db_dir, SeenIndex.DBFILENAME)
+        self._db = None
+
+    def __enter__(self):
+        # autocommit, every write locks the DB only for itself
+        self._db = sqlite3.connect(self.db_file,
+                                   timeout=SeenIndex.LOCK_TIMEOUT,
+                                   isolation_level=None)
+        self._db.execute('PRAGMA journal_mode = WAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS seen ('
+                         'key TEXT PRIMARY KEY, outcome TEXT, '
+                         'time REAL, url TEXT)')
+        return self
+
+    def __exit__(self, *_):
+        self._db.close()
+        self._db = None
+
+    @staticmethod
+    def get_key(entity):
+        '''get a key of the entity, the link if it is not from YouTube'''
+        return entity.yt_videoid or entity.link
+
+    def get(self, entity):
+        '''get (outcome, time, playlist URL) of the entity
+        or None if it has not been processed'''
+        return self._db.execute('SELECT outcome, time, url FROM seen '
+                                'WHERE key = ?',
+                                (SeenIndex.get_key(entity),)).fetchone()
+
+    def is_seen_elsewhere(self, entity, url):
+        '''check if the entity has been processed in another playlist;
+        the same playlist might be rolled back to process it again'''
+        seen = self.get(entity)
+        return seen is not None and seen[2] != url
+
+    def add(self, entity, outcome, url):
+        '''put the outcome of processing of the entity'''
+        self._db.execute('INSERT OR REPLACE INTO seen VALUES (?, ?, ?, ?)',
+                         (SeenIndex.get_key(entity), outcome,
+                          time.time(), url))
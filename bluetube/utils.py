@@ -1,3 +1,4 @@
+import os
 import re
 
 
@@ -18,3 +19,22 @@ def deemojify(text: str) -> str:
                    u"\U0001F1E0-\U0001F1FF"  # flags (iOS)
                    "]+", flags=re.UNICODE)
     return regrex_pattern.sub(r'□', text)
+
+
+def get_files_stamp(paths: list[str]) -> tuple:
+    """Get a stamp of files that changes when any of them is changed.
+
+    Args:
+        paths (list[str]): paths to files, some of them may not exist
+
+    Returns:
+        tuple: modification times and sizes of the files
+    """
+    stamp = []
+    for p in sorted(paths):
+        try:
+            st = os.stat(p)
+            stamp.append((p, st.st_mtime_ns, st.st_size))
+        except FileNotFoundError:
+            stamp.append((p, None, None))
+    return tuple(stamp)
@@ -3,14 +3,18 @@ The youtube-dl downloader.
 '''
 import logging
 import os
-from typing import Dict, List, Tuple
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple
 
 from mutagen import MutagenError, id3, mp3, mp4
 
 from bluetube.cli.events import Error
 from bluetube.commandexecutor import CommandExecutor
+from bluetube.downloadstore import DownloadStore
 from bluetube.eventpublisher import EventPublisher
-from bluetube.model import OutputFormatType
+from bluetube.model import DownloadInfo, OutputFormatType
 from bluetube.utils import deemojify
 
 
@@ -20,18 +24,82 @@ class YoutubeDlDownloader(object):
     '''
 
     NAME = "yt-dlp"  # ' a youtube-dl fork'
+    # printed for every video when it is in its final place
+    PRINT_TEMPLATE = ('after_move:%(id)s\t%(format_id)s\t'
+                      '%(duration)s\t%(filepath)s')
+
+    # the options that do not change downloaded files
+    COMMON_OPTIONS = ('--ignore-config',  # Do not read configuration files.
+                      '--ignore-errors',  # Continue on download errors
+                      '--mark-watched',   # Mark videos watched (YouTube only)
+                      )
+
+    # files left by an unfinished download e.g. "x.mp4.part-Frag3",
+    # "x.mp4.ytdl" or "x.temp.mp4" of a postprocessor
+    PARTIAL_FILE = re.compile(r'\.(part(-Frag\d+)?|ytdl)$|\.temp(\.\w+)?$')
 
     def __init__(self, executor: CommandExecutor,
                  publisher: EventPublisher,
-                 temp_dir: str) -> None:
+                 temp_dir: str,
+                 store: Optional[DownloadStore] = None) -> None:
         self._cache: Dict = {}
+        self._store = store
         self._executor = executor
         self._publisher = publisher
         self._temp_dir = temp_dir
         self._debug = logging.getLogger(__name__).debug
 
-    def download(self, entities, output_format, configs) -> Tuple[List, List]:
+    def set_temp_dir(self, temp_dir, store=None):
+        '''download to another directory e.g. of the next run;
+        the files of the previous one are forgotten'''
+        if temp_dir != self._temp_dir:
+            self._cache = {}
+            self._temp_dir = temp_dir
+        self._store = store
+
+    def download(self, entities, output_format, configs,
+                 concurrency=1, batch_size=1) -> Tuple[List, List]:
+        '''download the entities running up to concurrency
+        downloads at the same time, a download gets up to batch_size
+        links to start the downloader once for them'''
+        options = self._build_converter_options(output_format, configs)
+        return self._download(entities, options, concurrency, batch_size)
+
+    def download_sources(self, entities, output_format, all_configs,
+                         concurrency=1, batch_size=1) -> Tuple[List, List]:
+        '''download a file per entity that fits all the configs,
+        files for every configs are made from it locally'''
+        options = self._build_source_options(output_format, all_configs)
+        return self._download(entities, options, concurrency, batch_size)
+
+    def lookup(self, item, output_format, configs) -> bool:
+        '''find the file of the work item downloaded for the configs
+        before, in this run or in the store; don't download it'''
+        options = self._build_converter_options(output_format, configs)
+        info = self._get_downloaded(item.entity, options)
+        if info:
+            item.link = info.filename
+            item.info = info
+        return info is not None
+
+    def add_variant(self, entity, output_format, configs, filename):
+        '''take the file made from a downloaded one as the file
+        of the entity for the configs; return its DownloadInfo,
+        None if there is no such file'''
+        info = self._make_info(filename)
+        if info is None:
+            return None
+        self._add_metadata(entity, os.path.join(self._temp_dir, filename))
         options = self._build_converter_options(output_format, configs)
+        self._cache[' '.join(options + (entity.link,))] = info
+        if self._store and entity.yt_videoid:
+            self._store.put(entity.yt_videoid,
+                            YoutubeDlDownloader._get_format_options(options),
+                            self._temp_dir, info)
+        return info
+
+    def _download(self, entities, options, concurrency, batch_size):
+        '''download the entities with the options'''
         success: List = []
         failure: List = []
 
@@ -41,51 +109,134 @@ class YoutubeDlDownloader(object):
             failure = [en for en in entities]
             return success, failure
 
+        # the same link is downloaded once even if it is given twice
+        to_download: Dict = {}
+        format_options = YoutubeDlDownloader._get_format_options(options)
         for en in entities:
-            all_options = options + (en['link'],)
-
-            # check the value in the given cache
-            # to avoid downloading the same file twice
-            new_link = self._cache.get(' '.join(all_options))
-            if new_link:
-                self._debug(f'this link has been downloaded - {new_link}')
-                en['link'] = new_link
+            info = self._get_downloaded(en.entity, options)
+            if info:
+                self._debug(f'this link has been downloaded - {info}')
+                en.link = info.filename
+                en.info = info
                 success.append(en)
             else:
-                status = self._executor.call(all_options, cwd=self._temp_dir)
-                just_downloaded = [jd for jd in os.listdir(self._temp_dir)
-                                   if en['yt_videoid'] in jd]
-                assert len(just_downloaded) <= 1, \
-                    f"more than one file with {en['yt_videoid']}" +\
-                    "has just been downloaded"
-                if status:
-                    failure.append(en)
-                    # clear partially downloaded files if any
-                    for f in just_downloaded:
-                        os.unlink(os.path.join(self._temp_dir, f))
-                else:
-                    x = deemojify(just_downloaded[0])
-                    os.rename(os.path.join(self._temp_dir, just_downloaded[0]),
+                to_download.setdefault(en.link, []).append(en)
+
+        # make batches smaller to keep all workers busy
+        links = list(to_download)
+        concurrency = max(1, concurrency)
+        size = max(1, min(batch_size, -(-len(links) // concurrency)))
+        batches = [links[i:i + size] for i in range(0, len(links), size)]
+
+        # downloads wait for the network, so threads are enough;
+        # the results are handled here, in the calling thread
+        with ThreadPoolExecutor(concurrency) as pool:
+            futures = [pool.submit(self._download_batch, options,
+                                   {ln: to_download[ln][0].entity.yt_videoid
+                                    for ln in batch})
+                       for batch in batches]
+            for future in as_completed(futures):
+                for link, info in future.result().items():
+                    ens = to_download[link]
+                    if info is None:
+                        failure += ens
+                        continue
+                    x = deemojify(info.filename)
+                    os.rename(os.path.join(self._temp_dir, info.filename),
                               os.path.join(self._temp_dir, x))
-                    just_downloaded[0] = x
-                    self._add_metadata(en,
-                                       os.path.join(self._temp_dir,
-                                                    just_downloaded[0]))
-                    en['link'] = just_downloaded[0]
-                    success.append(en)
+                    info.filename = x
+                    self._add_metadata(ens[0].entity,
+                                       os.path.join(self._temp_dir, x))
+                    for en in ens:
+                        en.link = x
+                        en.info = info
+                    success += ens
 
-                    # put the link to just downloaded file into the cache
-                    self._cache[' '.join(all_options)] = just_downloaded[0]
+                    # put the just downloaded file into the cache
+                    self._cache[' '.join(options + (link,))] = info
+                    if self._store and ens[0].entity.yt_videoid:
+                        self._store.put(ens[0].entity.yt_videoid,
+                                        format_options, self._temp_dir, info)
 
         return success, failure
 
+    def _get_downloaded(self, entity, options):
+        '''get DownloadInfo of the entity downloaded with the options
+        before, None if it is neither in the cache nor in the store'''
+        key = ' '.join(options + (entity.link,))
+        # check the value in the given cache
+        # to avoid downloading the same file twice
+        info = self._cache.get(key)
+        if info and not os.path.exists(os.path.join(self._temp_dir,
+                                                    info.filename)):
+            # it has been sent and removed since then
+            del self._cache[key]
+            info = None
+        if not info and self._store and entity.yt_videoid:
+            # downloaded for another profile or by another run
+            info = self._store.get(entity.yt_videoid,
+                                   YoutubeDlDownloader._get_format_options(
+                                       options),
+                                   self._temp_dir)
+            if info:
+                self._cache[key] = info
+        return info
+
+    def _download_batch(self, options, video_ids):
+        '''download links given with their video IDs in a worker thread
+        by one call of the downloader; return DownloadInfo for every link,
+        None if it has failed'''
+        # the downloader prints the ID and the path of every
+        # downloaded video, so failures are known even if it has
+        # downloaded other videos of the batch
+        fd, printed = tempfile.mkstemp(prefix='bluetube-', suffix='.tsv')
+        os.close(fd)
+        try:
+            self._executor.call(options +
+                                ('--print-to-file',
+                                 YoutubeDlDownloader.PRINT_TEMPLATE,
+                                 printed) +
+                                tuple(video_ids),
+                                cwd=self._temp_dir)
+            with open(printed, encoding='utf-8') as f:
+                lines = [ln.rstrip('\n').split('\t', 3)
+                         for ln in f if ln.count('\t') >= 3]
+        finally:
+            os.remove(printed)
+        infos = {video_id: self._make_info(path, format_id, duration)
+                 for video_id, format_id, duration, path in lines}
+        ret = {}
+        for link, video_id in video_ids.items():
+            ret[link] = infos.get(video_id)
+            if ret[link] is None:
+                self._remove_partial(video_id)
+        return ret
+
+    def _make_info(self, path, format_id=None, duration=None):
+        '''describe the downloaded file, None if it does not exist'''
+        path = os.path.join(self._temp_dir, path)
+        if not os.path.exists(path):
+            return None
+        try:
+            duration = float(duration)
+        except (TypeError, ValueError):
+            duration = None  # NA for unknown fields
+        return DownloadInfo(os.path.basename(path),
+                            None if format_id == 'NA' else format_id,
+                            os.path.getsize(path), duration)
+
+    def _remove_partial(self, video_id):
+        '''clear partially downloaded files of the video if any;
+        finished files are kept, they might be made for other profiles'''
+        for f in os.listdir(self._temp_dir):
+            if video_id and video_id in f and \
+                    YoutubeDlDownloader.PARTIAL_FILE.search(f):
+                os.unlink(os.path.join(self._temp_dir, f))
+
     def _build_converter_options(self, output_format, configs):
         '''build options for the youtube-dl command line'''
 
-        options = ('--ignore-config',  # Do  not  read  configuration  files.
-                   '--ignore-errors',  # Continue on download errors
-                   '--mark-watched',   # Mark videos watched (YouTube only)
-                   )
+        options = YoutubeDlDownloader.COMMON_OPTIONS
         if output_format == OutputFormatType.audio:
             output_format = configs['output_format']
             spec_options = ('--extract-audio',
@@ -102,6 +253,26 @@ class YoutubeDlDownloader(object):
         all_options = (YoutubeDlDownloader.NAME,) + options + spec_options
         return all_options
 
+    def _build_source_options(self, output_format, all_configs):
+        '''build options to download a file that fits all the configs'''
+        if output_format == OutputFormatType.audio:
+            # the best audio is converted to every format locally
+            return (YoutubeDlDownloader.NAME,) + \
+                YoutubeDlDownloader.COMMON_OPTIONS + \
+                ('--format', 'bestaudio/best')
+        formats = {c.get('output_format') for c in all_configs} - {'', None}
+        # if one container is required, it fits the best quality as well;
+        # otherwise the best video is remuxed to every container locally
+        of = formats.pop() if len(formats) == 1 else ''
+        return self._build_converter_options(output_format,
+                                             {'output_format': of})
+
+    @staticmethod
+    def _get_format_options(options):
+        '''get the options that define downloaded files'''
+        return tuple(o for o in options[1:]
+                     if o not in YoutubeDlDownloader.COMMON_OPTIONS)
+
     def _check_downloader(self):
         return self._executor.does_command_exist(YoutubeDlDownloader.NAME)
 
@@ -0,0 +1,103 @@
+'''
+The in-process yt-dlp downloader.
+'''
+import itertools
+import threading
+from typing import Dict, List, Optional
+
+from bluetube.commandexecutor import CommandExecutor
+from bluetube.downloadstore import DownloadStore
+from bluetube.eventpublisher import EventPublisher
+from bluetube.ytdldownloader import YoutubeDlDownloader
+
+try:
+    import yt_dlp
+except ImportError:  # an optional dependency, see "engine" in configs.toml
+    yt_dlp = None
+
+
+class YtDlpEngine(YoutubeDlDownloader):
+    '''
+    The class downloads media by the yt-dlp Python package
+    in this process. The downloader objects are reused between videos,
+    so they keep the state of extractors and HTTP connections.
+    The options are the same as the command line ones
+    and are parsed by yt-dlp.
+    '''
+
+    def __init__(self, executor: CommandExecutor,
+                 publisher: EventPublisher,
+                 temp_dir: str,
+                 store: Optional[DownloadStore] = None) -> None:
+        super().__init__(executor, publisher, temp_dir, store)
+        # idle downloader objects by options, a worker takes one at a time
+        self._idle: Dict = {}
+        self._lock = threading.Lock()
+        self._progress_hooks: List = [self._log_progress]
+
+    @staticmethod
+    def is_available():
+        '''check if the yt-dlp package is installed'''
+        return yt_dlp is not None
+
+    def add_progress_hook(self, hook):
+        '''add a function that is called with a dict of the yt-dlp progress
+        of every download; it is called in worker threads'''
+        self._progress_hooks.append(hook)
+
+    def set_temp_dir(self, temp_dir, store=None):
+        super().set_temp_dir(temp_dir, store)
+        with self._lock:
+            for ydl in itertools.chain(*self._idle.values()):
+                ydl.params['paths'] = {'home': temp_dir}
+
+    def _check_downloader(self):
+        return YtDlpEngine.is_available()
+
+    def _download_batch(self, options, video_ids):
+        '''download links given with their video IDs in a worker thread
+        one by one; return DownloadInfo for every link,
+        None if it has failed'''
+        ydl = self._take(options)
+        try:
+            ret = {}
+            for link, video_id in video_ids.items():
+                ret[link] = self._download_one(ydl, link)
+                if ret[link] is None:
+                    self._remove_partial(video_id)
+            return ret
+        finally:
+            with self._lock:
+                self._idle[options].append(ydl)
+
+    def _download_one(self, ydl, link):
+        '''download the link, return DownloadInfo or None if it fails'''
+        try:
+            info = ydl.extract_info(link, download=True)
+        except yt_dlp.utils.YoutubeDLError as e:
+            self._debug(f'failed to download {link}: {e}')
+            return None
+        if not info:
+            return None  # the error is ignored by --ignore-errors
+        downloads = info.get('requested_downloads') or [{}]
+        path = downloads[-1].get('filepath') or ydl.prepare_filename(info)
+        return self._make_info(path, info.get('format_id'),
+                               info.get('duration'))
+
+    def _take(self, options):
+        '''take an idle downloader object for the options or make it'''
+        with self._lock:
+            idle = self._idle.setdefault(options, [])
+            if idle:
+                return idle.pop()
+        # skip the name of the command
+        params = yt_dlp.parse_options(list(options[1:])).ydl_opts
+        params.update(paths={'home': self._temp_dir},
+                      quiet=True,
+                      noprogress=True,
+                      progress_hooks=list(self._progress_hooks))
+        return yt_dlp.YoutubeDL(params)
+
+    def _log_progress(self, progress):
+        if progress.get('status') in ('finished', 'error'):
+            self._debug(f"{progress['status']}: {progress.get('filename')}")
@@ -1,15 +1,23 @@
+import asyncio
 import datetime
 import io
 import json
 import os
+import shelve
 import shutil
+import sqlite3
 import unittest
 from unittest.mock import AsyncMock, MagicMock, patch
 from zipfile import ZipFile
 
+import aiohttp
+
 from bluetube import Bluetube
-from bluetube.commandexecutor import cache
-from bluetube.model import OutputFormatType
+from bluetube.cli.events import Error, Warn
+from bluetube.commandexecutor import CommandExecutor
+from bluetube.feeds import Feeds
+from bluetube.model import OutputFormatType, Playlist
+from bluetube.opml import read_opml, write_opml
 from tests.fake_db import FAKE_DB, NEW_LINKS
 
 
@@ -32,37 +40,57 @@ def read_mocked_data():
 class TestBluetube(unittest.TestCase):
 
     TMP_DIR = '/tmp/bluetube_tests'  # sa: profiles.toml
+    HOME_DIR = '/tmp/bluetube_tests_home'
 
     def setUp(self):
         self.args = []
-        Bluetube._get_bt_dir = lambda _, __: \
-            os.path.dirname(os.path.abspath(__file__))
+        # the home directory with profiles and configs for tests
+        # where other files are created
+        os.makedirs(TestBluetube.HOME_DIR, exist_ok=True)
+        this_dir = os.path.dirname(os.path.abspath(__file__))
+        for fn in ('profiles.toml', 'configs.toml'):
+            shutil.copy(os.path.join(this_dir, fn), TestBluetube.HOME_DIR)
+        Bluetube._get_bt_dir = lambda _, __: TestBluetube.HOME_DIR
         self.mock_executor()
         self.sut = Bluetube(verbose=False)
         self.nbr_downloaded = 0
+        self.nbr_batches = 0
         self.nbr_converted = 0
         self.nbr_sent = 0
         os.makedirs(TestBluetube.TMP_DIR, Bluetube.ACCESS_MODE, exist_ok=True)
 
     def tearDown(self):
         patch.stopall()  # @UndefinedVariable
-        if os.path.exists(TestBluetube.TMP_DIR) \
-                and os.path.isdir(TestBluetube.TMP_DIR):
-            shutil.rmtree(TestBluetube.TMP_DIR)
-
-    def mock_db(self, fake_db, dct=None):
-        '''mock shelve DB with the fake DB'''
-        mock_db = MagicMock()
-        if dct:
-            mock_db.__setitem__.side_effect = dct.__setitem__
-        if isinstance(fake_db, dict):
-            mock_db.get.return_value = fake_db
-        elif isinstance(fake_db, str):
-            mock_db.get.return_value = json.loads(fake_db)
-        else:
-            assert 0, 'string or dictionary expected'
-        patcher = patch('shelve.open', return_value=mock_db)
-        return patcher.start()
+        for d in (TestBluetube.TMP_DIR, TestBluetube.HOME_DIR):
+            if os.path.exists(d) and os.path.isdir(d):
+                shutil.rmtree(d)
+
+    def make_db(self, fake_db):
+        '''make the shelve DB of older versions with the fake DB,
+        it is migrated to the SQLite DB'''
+        if isinstance(fake_db, str):
+            fake_db = json.loads(fake_db)
+        db_file = os.path.join(TestBluetube.HOME_DIR, Feeds.SHELVE_DBFILENAME)
+        with shelve.open(db_file) as db:
+            db['feeds'] = fake_db
+
+    def reset_db(self):
+        '''migrate the fake DB again to forget changes of a run'''
+        os.remove(Feeds.get_db_file(TestBluetube.HOME_DIR))
+        self.sut._loaded = {}
+
+    def read_db(self):
+        '''read authors and playlists from the SQLite DB'''
+        db = sqlite3.connect(Feeds.get_db_file(TestBluetube.HOME_DIR))
+        db.row_factory = sqlite3.Row
+        feeds = {}
+        for row in db.execute('SELECT author.name AS author, playlist.* '
+                              'FROM playlist JOIN author '
+                              'ON author.id = playlist.author_id '
+                              'ORDER BY author.id, playlist.id'):
+            feeds.setdefault(row['author'], []).append(dict(row))
+        db.close()
+        return [{'author': a, 'playlists': pls} for a, pls in feeds.items()]
 
     def mock_cli(self):
         ''' mock an event listener'''
@@ -94,7 +122,6 @@ class TestBluetube(unittest.TestCase):
         isdir.return_value = True
         return ex, isdir
 
-    @cache
     def call_side_effect(self, *args, **kwargs):
         ''' create a files from the URL as the youtube-dl does
             or
@@ -105,10 +132,18 @@ class TestBluetube(unittest.TestCase):
         self.args.append(str_args)
 
         if args[0][0] in ['youtube-dl', 'yt-dlp']:
-            fake_name = args[0][-1].split('=')[1]
-            open(os.path.join(kwargs.get('cwd', TestBluetube.TMP_DIR),
-                              fake_name), 'w').close()
-            self.nbr_downloaded += 1
+            # the links follow the file to print paths to
+            i = args[0].index('--print-to-file') + 2
+            with open(args[0][i], 'w') as printed:
+                for link in args[0][i + 1:]:
+                    fake_name = link.split('=')[1]
+                    path = os.path.join(kwargs.get('cwd',
+                                                   TestBluetube.TMP_DIR),
+                                        fake_name)
+                    open(path, 'w').close()
+                    printed.write(f'{fake_name}\t18\tNA\t{path}\n')
+                    self.nbr_downloaded += 1
+            self.nbr_batches += 1
         elif args[0][0] == 'ffmpeg':
             open(os.path.join(kwargs.get('cwd', TestBluetube.TMP_DIR),
                               args[0][-1]), 'w').close()
@@ -166,7 +201,7 @@ class TestBluetube(unittest.TestCase):
 
     def test_run(self):
         '''an origin good usage'''
-        mdb = self.mock_db(FAKE_DB)
+        self.make_db(FAKE_DB)
         inp, _ = self.mock_cli()
         mock_send = MagicMock(side_effect=self.bt_side_effect)
         bt = self.mock_sender(found=True, connect=True, send=mock_send)
@@ -175,15 +210,18 @@ class TestBluetube(unittest.TestCase):
 
         self.sut.run()
 
-        self.assertEqual(2, mdb.call_count,
-                         'should be called for read and write')
+        self.assertTrue(all(pl['last_fetch']
+                            for a in self.read_db() for pl in a['playlists']),
+                        'fetched playlists should be saved')
 
         self.assertEqual(fetch.await_count, FAKE_DB.count('"url"'))
 
         self.assertEqual(inp.ask.call_count, NEW_LINKS)
 
         self.assertEqual(NEW_LINKS, self.nbr_downloaded)
-        self.assertEqual(self.nbr_downloaded + self.nbr_converted,
+        self.assertLess(self.nbr_batches, self.nbr_downloaded,
+                        'links should be downloaded in batches')
+        self.assertEqual(self.nbr_batches + self.nbr_converted,
                          self.sut.factory._executor.call.call_count)
 
         bt.assert_called()
@@ -193,9 +231,32 @@ class TestBluetube(unittest.TestCase):
         self.assertEqual(NEW_LINKS+2, mock_copy.call_count,
                          'wrong number of copies, see profiles.toml')
 
+    def test_run_derive_formats(self):
+        '''profiles need different video formats'''
+        path = os.path.join(TestBluetube.HOME_DIR, 'profiles.toml')
+        with open(path, 'a') as f:
+            f.write('\n    [local.video]\n    output_format = "webm"\n')
+        self.make_db(FAKE_DB)
+        self.mock_cli()
+        self.mock_sender(found=True, connect=True,
+                         send=MagicMock(side_effect=self.bt_side_effect))
+        self.mock_remote_data()
+        self.mock_shutil_copy()
+
+        self.sut.run()
+
+        self.assertEqual(NEW_LINKS, self.nbr_downloaded,
+                         'a video should be downloaded once for all profiles')
+        remuxed = [a for a in self.args
+                   if a.startswith('ffmpeg') and '-codec copy' in a]
+        self.assertTrue(remuxed)
+        exts = [os.path.splitext(a)[1] for a in remuxed]
+        self.assertEqual(exts.count('.mp4'), exts.count('.webm'),
+                         'a file should be made for every profile')
+
     def test_run_download_failed(self):
         '''failed all downloads'''
-        self.mock_db(FAKE_DB)
+        self.make_db(FAKE_DB)
         self.mock_cli()
         self.sut.factory._executor = MagicMock()
         self.sut.factory._executor.call.side_effect = \
@@ -208,8 +269,9 @@ class TestBluetube(unittest.TestCase):
         self.sut.run()
 
         self.assertEqual(0, self.nbr_downloaded)
-        self.assertEqual(NEW_LINKS + 2,
-                         self.sut.factory._executor.call.call_count,
+        calls = self.sut.factory._executor.call.call_args_list
+        links = [a for c in calls for a in c[0][0] if a.startswith('http')]
+        self.assertEqual(NEW_LINKS + 2, len(links),
                          'download does not cache failed attempts,'
                          'so it should called for every link in every profile')
         bt.assert_not_called()
@@ -224,7 +286,7 @@ class TestBluetube(unittest.TestCase):
         self.sut.inputer = cli
         self.sut.outputer = MagicMock()
 
-        mdb = self.mock_db(FAKE_DB)
+        self.make_db(FAKE_DB)
         self.mock_executor()
         mock_send = MagicMock(side_effect=self.bt_side_effect)
         bt = self.mock_sender(found=True, connect=True, send=mock_send)
@@ -232,31 +294,244 @@ class TestBluetube(unittest.TestCase):
 
         self.sut.run()
 
-        self.assertEqual(2, mdb.call_count,
-                         'should be called for read and write')
+        self.assertTrue(all(pl['last_fetch']
+                            for a in self.read_db() for pl in a['playlists']),
+                        'fetched playlists should be saved')
 
         self.assertEqual(fetch.await_count, FAKE_DB.count('"url"'))
         self.assertEqual(cli.ask.call_count, NEW_LINKS)
         bt.assert_not_called()
         self.assertEqual(mock_send.call_count, 0)
 
+    def test_run_seen_elsewhere(self):
+        '''a video is offered once even if it is in several playlists'''
+        self.make_db(FAKE_DB)
+        inp, _ = self.mock_cli()
+        inp.ask.return_value = False
+        md = read_mocked_data()
+        self.sut._fetch_rss = AsyncMock(return_value=md[0].encode())
+
+        self.sut.run()
+
+        asked = [c[0][0].yt_videoid for c in inp.ask.call_args_list]
+        self.assertEqual(len(set(asked)), len(asked))
+        self.assertEqual(md[0].count('<entry>'), len(asked))
+
+    def test_run_not_modified(self):
+        '''feeds that have not been modified are not processed'''
+        self.make_db(FAKE_DB)
+        inp, _ = self.mock_cli()
+        bt = self.mock_sender(found=True, connect=True, send=MagicMock())
+        fetch = AsyncMock(return_value=None)
+        self.sut._fetch_rss = fetch
+
+        self.sut.run()
+
+        self.assertTrue(all(pl['last_fetch']
+                            for a in self.read_db() for pl in a['playlists']),
+                        'fetched playlists should be saved')
+        self.assertEqual(fetch.await_count, FAKE_DB.count('"url"'))
+        inp.ask.assert_not_called()
+        self.assertEqual(0, self.nbr_downloaded)
+        bt.assert_not_called()
+
+    def test_run_offline(self):
+        '''feeds are replayed from the cache of the previous run'''
+        self.make_db(FAKE_DB)
+        inp, _ = self.mock_cli()
+        inp.ask.return_value = False
+        self.mock_remote_data()
+        self.sut.run()
+        self.reset_db()
+        fetch = AsyncMock()
+        self.sut._fetch_rss = fetch
+
+        for _ in range(2):
+            inp.ask.reset_mock()
+            self.sut.run(offline=True)
+            self.assertEqual(NEW_LINKS, inp.ask.call_count,
+                             'the playlists should not be moved forward')
+
+        fetch.assert_not_awaited()
+
+    def test_run_max_feed_age(self):
+        '''only feeds that are too old are fetched'''
+        self.make_db(FAKE_DB)
+        inp, _ = self.mock_cli()
+        inp.ask.return_value = False
+        self.mock_remote_data()
+        self.sut.run()
+        fetch = self.mock_remote_data()
+
+        self.reset_db()
+        self.sut.run(max_feed_age=60)
+        fetch.assert_not_awaited()
+        self.reset_db()
+        self.sut.run(max_feed_age=0)
+        self.assertEqual(fetch.await_count, FAKE_DB.count('"url"'))
+
+    @patch('random.uniform', return_value=0)
+    def test_run_fetch_failed(self, _):
+        '''a feed that failed does not affect others'''
+        self.make_db(FAKE_DB)
+        inp, out = self.mock_cli()
+        self.mock_sender(found=True, connect=True,
+                         send=MagicMock(side_effect=self.bt_side_effect))
+        self.mock_shutil_copy()
+        md = read_mocked_data()
+        failed_url = json.loads(FAKE_DB)[0]['playlists'][0]['url']
+
+        def fetch_side_effect(_, pl):
+            if pl.url == failed_url:
+                raise aiohttp.ServerDisconnectedError()
+            feed_id = pl.url.split('=')[1]
+            return [ln.encode() for ln in md if feed_id in ln][0]
+
+        fetch = AsyncMock(side_effect=fetch_side_effect)
+        self.sut._fetch_rss = fetch
+
+        self.sut.run()
+
+        self.assertEqual(3 + len(md) - 1, fetch.await_count,
+                         'the first feed should be tried 3 times')
+        self.assertTrue(inp.ask.call_count, 'other feeds are processed')
+        errors = [c[0][0] for c in out.update.call_args_list
+                  if c[0][0].msg == 'failed to fetch']
+        self.assertEqual(1, len(errors))
+        pl = self.read_db()[0]['playlists'][0]
+        self.assertEqual(1, pl['fetch_failures'])
+        self.assertTrue(pl['last_fetch_failure'])
+
+    def test__fetch_rss_conditional_get(self):
+        '''validators are sent and updated'''
+        pl = Playlist('title', 'url')
+        pl.etag = '"etag"'
+        pl.last_modified = 'Tue, 28 Jul 2020 15:31:18 GMT'
+        response = MagicMock(status=304)
+        session = MagicMock()
+        session.get.return_value.__aenter__.return_value = response
+
+        self.assertIsNone(asyncio.run(self.sut._fetch_rss(session, pl)))
+        headers = session.get.call_args.kwargs['headers']
+        self.assertEqual('"etag"', headers['If-None-Match'])
+        self.assertEqual(pl.last_modified, headers['If-Modified-Since'])
+
+        response.status = 200
+        response.headers = {'ETag': '"new"'}
+        response.read = AsyncMock(return_value=b'<feed/>')
+        self.assertEqual(b'<feed/>',
+                         asyncio.run(self.sut._fetch_rss(session, pl)))
+        self.assertEqual('"new"', pl.etag)
+        self.assertIsNone(pl.last_modified)
+
+    def test_run_daemon(self):
+        '''runs are repeated, resources are kept between them'''
+        self.make_db(FAKE_DB)
+        self.mock_cli()
+        self.mock_sender(found=True, connect=True,
+                         send=MagicMock(side_effect=self.bt_side_effect))
+        self.mock_shutil_copy()
+        md = [ln.encode() for ln in read_mocked_data()]
+        self.sut._fetch_rss = AsyncMock(side_effect=md + [None] * len(md))
+        sessions = []
+        orig_run = self.sut.run
+
+        def run(full):
+            orig_run(full)
+            sessions.append(self.sut._session)
+
+        self.sut.run = MagicMock(side_effect=run)
+        with patch('time.sleep', side_effect=[None, StopIteration]):
+            with self.assertRaises(StopIteration):
+                self.sut.run_daemon(60, full=True)
+
+        self.assertEqual([((True,),), ((False,),)],
+                         self.sut.run.call_args_list,
+                         'only the first run should be full')
+        self.assertIsNotNone(sessions[0])
+        self.assertIs(sessions[0], sessions[1])
+        self.sut._close_fetch_resources()
+
+    def test_run_daemon_convert_again(self):
+        '''a file of the same name is converted in every run'''
+        self.make_db(FAKE_DB)
+        self.mock_cli()
+        self.mock_sender(found=True, connect=True,
+                         send=MagicMock(side_effect=self.bt_side_effect))
+        self.mock_shutil_copy()
+        md = [ln.encode() for ln in read_mocked_data()]
+        self.sut._fetch_rss = AsyncMock(side_effect=md + md)
+        # the daemon keeps a real executor, only processes are mocked
+        self.sut.executor = self.sut.factory._executor = CommandExecutor()
+        patch('subprocess.call',
+              side_effect=lambda args, cwd, **_:
+              0 if args[-1].endswith('-version')  # probes
+              else self.call_side_effect(args, cwd=cwd)).start()
+        converted = []
+        orig_run = self.sut.run
+
+        def run(full):
+            self.nbr_converted = 0
+            orig_run(full)
+            converted.append(self.nbr_converted)
+            # the same videos are offered by the next run
+            self.reset_db()
+            self.args = []
+
+        self.sut.run = MagicMock(side_effect=run)
+        with patch('time.sleep', side_effect=[None, StopIteration]):
+            with self.assertRaises(StopIteration):
+                self.sut.run_daemon(60)
+
+        self.assertTrue(converted[0])
+        self.assertEqual(converted[0], converted[1])
+        self.sut._close_fetch_resources()
+
+    def test_run_daemon_failed(self):
+        '''a failed run does not stop the daemon and leaves no directory'''
+        self.make_db(FAKE_DB)
+        _, out = self.mock_cli()
+        md = [ln.encode() for ln in read_mocked_data()]
+        self.sut._fetch_rss = AsyncMock(side_effect=md + [None] * len(md))
+        self.sut._process_playlists = MagicMock(
+            side_effect=[RuntimeError('disk full'), []])
+        with patch('time.sleep', side_effect=[None, StopIteration]):
+            with self.assertRaises(StopIteration):
+                self.sut.run_daemon(60)
+
+        self.assertEqual(2, self.sut._process_playlists.call_count)
+        errors = [c[0][0] for c in out.update.call_args_list
+                  if isinstance(c[0][0], Error)]
+        self.assertEqual(['run failed'], [e.msg for e in errors])
+        self.assertEqual([], os.listdir(
+            os.path.join(TestBluetube.HOME_DIR, Bluetube.RUNS_DIRNAME)))
+        self.sut._close_fetch_resources()
+
+    def test__load_cached(self):
+        path = os.path.join(TestBluetube.TMP_DIR, 'file')
+        load = MagicMock(side_effect=[1, 2])
+        self.assertEqual(1, self.sut._load_cached('k', [path], load))
+        self.assertEqual(1, self.sut._load_cached('k', [path], load))
+        with open(path, 'w') as f:
+            f.write('changed')
+        self.assertEqual(2, self.sut._load_cached('k', [path], load))
+        self.assertEqual(2, load.call_count)
+
     def test_empty_DB(self):
         '''inform about the empty DB and do nothing'''
-        mdb = self.mock_db({})
+        self.make_db([])
         self.mock_executor()
         _, out = self.mock_cli()
 
         self.sut.run()
 
-        mdb.assert_called_once()
         self.assertEqual(2, out.update.call_count)  # 1st is 'Updating feeds.'
         self.assertEquals('empty database', out.update.call_args[0][0].msg)
         out.feeds_updated.assert_not_called()
 
     def test_add_playlist(self):
         self.mock_cli()
-        d = {'feeds': []}
-        self.mock_db(FAKE_DB, d)
+        self.make_db(FAKE_DB)
 
         url = 'https://www.youtube.com/channel/UCSHZKyawb77ixDdsGog4iWA'
         out_format = 'video'
@@ -274,10 +549,88 @@ class TestBluetube(unittest.TestCase):
                                          'title': t+em})})
             with patch('feedparser.parse', return_value=parsed):
                 self.sut.add_playlist(url, out_format, profiles)
-                self.assertTrue(self.check_author_title(d['feeds'],
+                self.assertTrue(self.check_author_title(self.read_db(),
                                                         a+"□",
                                                         t+"□"))
 
+    def test_import_playlists(self):
+        '''feeds are validated and added at once'''
+        _, out = self.mock_cli()
+        self.make_db(FAKE_DB)
+        md = [ln.encode() for ln in read_mocked_data()]
+        new_feed = b'''<feed xmlns="http://www.w3.org/2005/Atom">
+            <title>title</title><author><name>author</name></author>
+            </feed>'''
+        urls = ['https://www.youtube.com/feeds/videos.xml?channel_id=1',
+                'https://www.youtube.com/feeds/videos.xml?channel_id=2',
+                'https://www.youtube.com/feeds/videos.xml?channel_id=3',
+                'https://www.youtube.com/channel/4',
+                'https://www.youtube.com/feeds/videos.xml?channel_id=5']
+
+        def fetch_side_effect(_, pl):
+            if pl.url.endswith('=3'):
+                raise aiohttp.ClientResponseError(None, (), status=404)
+            return {'1': b'not a feed', '2': new_feed,
+                    '4': md[1], '5': md[2]}[pl.url[-1]]
+
+        self.sut._fetch_rss = AsyncMock(side_effect=fetch_side_effect)
+        opml = os.path.join(TestBluetube.TMP_DIR, 'subscriptions.opml')
+        write_opml(opml, [{'author': 'a',
+                           'playlists': [Playlist(str(i), u)
+                                         for i, u in enumerate(urls)]}])
+
+        self.sut.import_playlists(opml, OutputFormatType.audio, ['mobile'])
+
+        errors = [c[0][0].msg for c in out.update.call_args_list
+                  if isinstance(c[0][0], Error)]
+        self.assertEqual(['not a feed', 'failed to fetch', 'playlist exists',
+                          'playlist exists'], errors)
+        self.assertEqual(1, out.update.call_args[0][0].args[0])
+        self.assertTrue(self.check_author_title(self.read_db(),
+                                                'author', 'title'))
+
+    def test_export_playlists(self):
+        self.mock_cli()
+        self.make_db(FAKE_DB)
+        opml = os.path.join(TestBluetube.TMP_DIR, 'subscriptions.opml')
+
+        self.sut.export_playlists(opml)
+
+        self.assertEqual(FAKE_DB.count('"url"'), len(read_opml(opml)))
+
+    def test_query_playlists(self):
+        self.make_db(FAKE_DB)
+        out = io.StringIO()
+
+        self.sut.query_playlists(out, author='24 Канал')
+
+        lines = out.getvalue().splitlines()
+        self.assertEqual(2, len(lines))
+        self.assertEqual('Чесна політика', json.loads(lines[1])['title'])
+
+        out = io.StringIO()
+        self.sut.query_playlists(out, 'tsv', profile='local')
+
+        lines = [ln.split('\t') for ln in out.getvalue().splitlines()]
+        self.assertEqual(2, len(lines))
+        self.assertEqual('ТаТоТаке', lines[1][lines[0].index('title')])
+        self.assertEqual('mobile,local',
+                         lines[1][lines[0].index('profiles')])
+
+    def test_backup_restore_db(self):
+        self.make_db(FAKE_DB)
+        self.mock_cli()
+        path = os.path.join(TestBluetube.TMP_DIR, 'backup.jsonl.gz')
+
+        self.sut.backup_db(path)
+        self.sut.remove_playlist('ТаТоТаке', 'ТаТоТаке')
+        self.sut.restore_db(path)
+
+        self.assertTrue(self.check_author_title(self.read_db(),
+                                                'ТаТоТаке', 'ТаТоТаке'))
+        self.assertEqual(FAKE_DB.count('"url"'),
+                         sum(len(a['playlists']) for a in self.read_db()))
+
     def test__get_feed_url(self):
         '''test possible URLs of playlists'''
         exp_id = 'UCSHZKyawb77ixDdsGog4iWA'
@@ -296,15 +649,14 @@ class TestBluetube(unittest.TestCase):
 
     def test_remove_playlist(self):
         self.mock_cli()
-        d = {'feeds': []}
-        self.mock_db(FAKE_DB, d)
+        self.make_db(FAKE_DB)
         a = t = 'ТаТоТаке'
         self.sut.remove_playlist(a, t)
-        self.assertTrue(len(d['feeds']))
-        self.assertFalse(self.check_author_title(d['feeds'], a, t))
+        self.assertTrue(len(self.read_db()))
+        self.assertFalse(self.check_author_title(self.read_db(), a, t))
 
     def test_send(self):
-        self.mock_db(FAKE_DB)
+        self.make_db(FAKE_DB)
         _, out = self.mock_cli()
         self.mock_listdir([])
 
@@ -312,10 +664,65 @@ class TestBluetube(unittest.TestCase):
         out.update.assert_called_once()
         self.assertEquals('Nothing to send.', out.update.call_args[0][0].msg)
 
+    @patch('tempfile.gettempdir', lambda: TestBluetube.TMP_DIR)
+    def test_isolated_temp_dirs(self):
+        _, out = self.mock_cli()
+        other = Bluetube(verbose=False)
+        self.sut._fetch_temp_dir(isolated=True)
+        other._fetch_temp_dir(isolated=True)
+        self.assertNotEqual(self.sut.temp_dir, other.temp_dir)
+        outbox = os.path.join(TestBluetube.TMP_DIR, 'bluetube')
+        runs_dir = os.path.join(TestBluetube.HOME_DIR, Bluetube.RUNS_DIRNAME)
+        self.assertEqual(runs_dir, os.path.dirname(self.sut.temp_dir),
+                         'runs should be on the file system of the store')
+        run_dir = self.sut.temp_dir
+        open(os.path.join(run_dir, 'not_sent.mp3'), 'w').close()
+
+        self.sut._return_temp_dir()
+        self.assertFalse(os.path.exists(run_dir))
+        self.assertEqual(['not_sent.mp3'], os.listdir(outbox),
+                         'not sent files are left for the send command')
+        self.assertEqual([os.path.basename(other.temp_dir)],
+                         os.listdir(runs_dir),
+                         'the directory of another run is kept')
+        out.update.assert_called()
+        other._return_temp_dir()
+        self.assertEqual(['not_sent.mp3'], os.listdir(outbox))
+        self.assertEqual([], os.listdir(runs_dir))
+
+    @patch('tempfile.gettempdir', lambda: TestBluetube.TMP_DIR)
+    def test_return_temp_dir_same_name(self):
+        _, out = self.mock_cli()
+        other = Bluetube(verbose=False)
+        other._subscribers.append(out)
+        for sut in (self.sut, other):
+            sut._fetch_temp_dir(isolated=True)
+            with open(os.path.join(sut.temp_dir, 'not_sent.mp3'), 'w') as f:
+                f.write(sut.temp_dir)
+        run_dir, other_dir = self.sut.temp_dir, other.temp_dir
+        self.sut._return_temp_dir()
+        with patch('shutil.move', side_effect=OSError('disk full')):
+            other._return_temp_dir()
+
+        outbox = os.path.join(TestBluetube.TMP_DIR, 'bluetube')
+        with open(os.path.join(outbox, 'not_sent.mp3')) as f:
+            self.assertEqual(run_dir, f.read(), 'should not be overwritten')
+        self.assertTrue(os.path.exists(os.path.join(other_dir,
+                                                    'not_sent.mp3')),
+                        'a file that is not moved should be kept')
+        warns = [c[0][0].msg for c in out.update.call_args_list
+                 if isinstance(c[0][0], Warn)]
+        self.assertIn('file not moved', warns)
+
+        other._fetch_temp_dir(isolated=True)
+        open(os.path.join(other.temp_dir, 'not_sent.mp3'), 'w').close()
+        other._return_temp_dir()
+        self.assertEqual(['not_sent (1).mp3', 'not_sent.mp3'],
+                         sorted(os.listdir(outbox)))
+
     def test_edit_playlist(self):
         _, out = self.mock_cli()
-        d = {'feeds': []}
-        self.mock_db(FAKE_DB, d)
+        self.make_db(FAKE_DB)
         a = '24 Канал'
         t = 'Чесна політика'
 
@@ -330,7 +737,7 @@ class TestBluetube(unittest.TestCase):
                                reset_failed=True,
                                days_back=90)
         out.warn.assert_not_called()
-        pl = d['feeds'][1]['playlists'][1]
+        pl = self.read_db()[1]['playlists'][1]
         self.assertEqual(old_last_update - pl['last_update'],
                          datetime.timedelta(days=int(90)).total_seconds(),
                          'unexpected last update')
@@ -1,11 +1,12 @@
 
 import unittest
-from unittest.mock import Mock
+from unittest.mock import Mock, patch
 
 from bluetube.cli import Inputer, Outputer
 from bluetube.commandexecutor import CommandExecutor
 from bluetube.componentfactory import ComponentFactory
 from bluetube.ytdldownloader import YoutubeDlDownloader
+from bluetube.ytdlpengine import YtDlpEngine
 
 
 class TestComponentFactory(unittest.TestCase):
@@ -22,6 +23,28 @@ class TestComponentFactory(unittest.TestCase):
         self.assertIsNotNone(self.sut._executor)
         self.assertIsInstance(dl, YoutubeDlDownloader)
 
+    def test_get_downloader_in_process(self):
+        publisher = Mock()
+        with patch('bluetube.ytdlpengine.yt_dlp', Mock()):
+            dl = self.sut.get_downloader(publisher, 'dir',
+                                         ComponentFactory.IN_PROCESS)
+        self.assertIsInstance(dl, YtDlpEngine)
+        with patch('bluetube.ytdlpengine.yt_dlp', None):
+            dl = ComponentFactory().get_downloader(
+                publisher, 'dir', ComponentFactory.IN_PROCESS)
+        self.assertNotIsInstance(dl, YtDlpEngine)
+        publisher.notify.assert_called_once()
+
+    def test_get_downloader_for_runs(self):
+        dl = self.sut.get_downloader(Mock(), 'run1')
+        dl._cache['key'] = 'info'
+        self.assertIs(dl, self.sut.get_downloader(Mock(), 'run1'))
+        self.assertEqual('info', dl._cache['key'])
+        self.assertIs(dl, self.sut.get_downloader(Mock(), 'run2'),
+                      'a downloader should be reused by the next run')
+        self.assertEqual('run2', dl._temp_dir)
+        self.assertEqual({}, dl._cache)
+
     def test_get_inputer(self):
         inputer = self.sut.get_inputer(True)
         self.assertIsNotNone(self.sut._executor)
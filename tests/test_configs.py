@@ -40,6 +40,22 @@ default = ""
         self.assertEqual(player, self.SUT.get_media_player(),
                          'unexpected media player')
 
+    def test_get_feeds_options(self):
+        options = self.SUT.get_feeds_options()
+        self.assertEqual(Configs.FEEDS_DEFAULTS, options,
+                         'defaults expected if there is no section')
+        self.SUT._configs['feeds'] = {'concurrency': 4}
+        options = self.SUT.get_feeds_options()
+        self.assertEqual(4, options['concurrency'])
+        self.assertEqual(Configs.FEEDS_DEFAULTS['timeout'],
+                         options['timeout'])
+
+    def test_get_download_options(self):
+        self.assertEqual(Configs.DOWNLOAD_DEFAULTS,
+                         self.SUT.get_download_options())
+        self.SUT._configs['download'] = {'concurrency': 8}
+        self.assertEqual(8, self.SUT.get_download_options()['concurrency'])
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,62 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+from bluetube.converter import FfmpegConverter
+from bluetube.model import OutputFormatType
+
+
+class TestFfmpegConverter(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.executor = MagicMock()
+        self.publisher = MagicMock()
+        self.sut = FfmpegConverter(self.executor, self.publisher, self.dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_can_derive(self):
+        self.assertTrue(self.sut.can_derive(OutputFormatType.audio,
+                                            {'output_format': 'mp3'}))
+        self.assertTrue(self.sut.can_derive(OutputFormatType.video,
+                                            {'output_format': ''}))
+        self.assertFalse(self.sut.can_derive(OutputFormatType.video,
+                                             {'output_format': 'best[h<480]'}))
+
+    def test_derive_audio(self):
+        self.executor.call.return_value = 0
+        new = self.sut.derive('a [id].webm', OutputFormatType.audio,
+                              {'output_format': 'vorbis'})
+        self.assertEqual('a [id].ogg', new)
+        args = self.executor.call.call_args[0][0]
+        self.assertEqual(os.path.join(self.dir, 'a [id].webm'),
+                         args[args.index('-i') + 1])
+        self.assertIn('libvorbis', args)
+        self.assertEqual('a [id].webm',
+                         self.sut.derive('a [id].webm', OutputFormatType.audio,
+                                         {'output_format': 'best'}))
+
+    def test_derive_video(self):
+        # the remux fails, the conversion succeeds
+        self.executor.call.side_effect = [1, 0]
+        new = self.sut.derive('a.webm', OutputFormatType.video,
+                              {'output_format': 'mp4'})
+        self.assertEqual('a.mp4', new)
+        self.assertEqual(2, self.executor.call.call_count)
+        self.assertEqual('a.mp4', self.sut.derive('a.mp4',
+                                                  OutputFormatType.video,
+                                                  {'output_format': 'mp4'}))
+
+    def test_derive_failed(self):
+        self.executor.call.return_value = 1
+        self.assertIsNone(self.sut.derive('a.webm', OutputFormatType.audio,
+                                          {'output_format': 'mp3'}))
+        self.publisher.notify.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+from bluetube.downloadstore import DownloadStore
+from bluetube.model import DownloadInfo
+
+
+class TestDownloadStore(unittest.TestCase):
+
+    OPTIONS = ('--format', 'mp4')
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.src = os.path.join(self.dir, 'src')
+        self.dest = os.path.join(self.dir, 'dest')
+        os.mkdir(self.src)
+        os.mkdir(self.dest)
+        self.sut = DownloadStore(self.dir, 100)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def put(self, video_id, size=10):
+        name = f'{video_id}.mp4'
+        with open(os.path.join(self.src, name), 'wb') as f:
+            f.write(b'0' * size)
+        self.sut.put(video_id, TestDownloadStore.OPTIONS, self.src,
+                     DownloadInfo(name, '18', size, 60.0))
+
+    def make_old(self, video_id, age):
+        t = time.time() - age
+        path = self.sut.get_path(video_id, TestDownloadStore.OPTIONS)
+        os.utime(path, (t, t))
+
+    def test_put_get(self):
+        self.assertIsNone(self.sut.get('id1', TestDownloadStore.OPTIONS,
+                                       self.dest))
+        self.put('id1')
+        self.assertIsNone(self.sut.get('id1', ('--format', 'webm'),
+                                       self.dest), 'other options')
+        info = self.sut.get('id1', TestDownloadStore.OPTIONS, self.dest)
+        self.assertEqual(('id1.mp4', '18', 10, 60.0),
+                         (info.filename, info.format, info.size,
+                          info.duration))
+        self.assertTrue(os.path.samefile(os.path.join(self.src, 'id1.mp4'),
+                                         os.path.join(self.dest, 'id1.mp4')),
+                        'a hard link is expected')
+
+    @patch('os.link', side_effect=OSError(18, 'Invalid cross-device link'))
+    def test_copy(self, _):
+        with self.assertLogs('bluetube.downloadstore', 'WARNING') as logs:
+            self.put('id1')
+            self.sut.get('id1', TestDownloadStore.OPTIONS, self.dest)
+        self.assertEqual(1, len(logs.output), 'reported once')
+        with open(os.path.join(self.dest, 'id1.mp4'), 'rb') as f:
+            self.assertEqual(b'0' * 10, f.read())
+
+    def test_prune(self):
+        # a file and its description take about 110 bytes
+        self.sut = DownloadStore(self.dir, 250)
+        for i, age in enumerate((300, 100, 200, 0)):
+            self.put(f'id{i}', 40)
+            self.make_old(f'id{i}', age)
+        self.sut.get('id0', TestDownloadStore.OPTIONS, self.dest)  # used now
+        self.sut.prune()
+        kept = [i for i in range(4)
+                if os.path.exists(self.sut.get_path(
+                    f'id{i}', TestDownloadStore.OPTIONS))]
+        self.assertEqual([0, 3], kept, 'the least recently used are removed')
+
+    def test_disabled(self):
+        self.sut = DownloadStore(self.dir, 0)
+        self.put('id1')
+        self.assertIsNone(self.sut.get('id1', TestDownloadStore.OPTIONS,
+                                       self.dest))
+        self.assertFalse(os.path.exists(self.sut.store_dir))
+
+
+if __name__ == "__main__":
+    unittest.main()
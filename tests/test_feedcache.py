@@ -0,0 +1,82 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from bluetube.feedcache import FeedCache
+
+
+class TestFeedCache(unittest.TestCase):
+
+    URL = 'https://www.youtube.com/feeds/videos.xml?channel_id=XXX'
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.sut = FeedCache(self.dir, 60)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def make_old(self, age):
+        t = time.time() - age
+        os.utime(self.sut.get_path(TestFeedCache.URL), (t, t))
+
+    def test_put_get(self):
+        self.assertIsNone(self.sut.get(TestFeedCache.URL))
+        self.sut.put(TestFeedCache.URL, b'<feed/>')
+        self.assertEqual(b'<feed/>', self.sut.get(TestFeedCache.URL))
+        self.assertEqual(b'<feed/>', self.sut.get(TestFeedCache.URL, 10))
+
+    def test_get_expired(self):
+        self.sut.put(TestFeedCache.URL, b'<feed/>')
+        self.make_old(30)
+        self.assertIsNone(self.sut.get(TestFeedCache.URL, 10))
+        self.assertIsNotNone(self.sut.get(TestFeedCache.URL))
+        self.make_old(90)
+        self.assertIsNone(self.sut.get(TestFeedCache.URL))
+
+    def test_touch(self):
+        self.sut.put(TestFeedCache.URL, b'<feed/>')
+        self.make_old(30)
+        self.sut.touch(TestFeedCache.URL)
+        self.assertIsNotNone(self.sut.get(TestFeedCache.URL, 10))
+
+    def test_prune(self):
+        self.sut.put(TestFeedCache.URL, b'<feed/>')
+        self.sut.prune()
+        self.assertTrue(os.path.exists(self.sut.get_path(TestFeedCache.URL)))
+        self.make_old(90)
+        self.sut.prune()
+        self.assertEqual([], os.listdir(self.sut.cache_dir))
+
+    def test_put_concurrently(self):
+        def put():
+            for _ in range(50):
+                self.sut.put(TestFeedCache.URL, b'<feed/>')
+        threads = [threading.Thread(target=put) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(b'<feed/>', self.sut.get(TestFeedCache.URL))
+        self.assertEqual(1, len(os.listdir(self.sut.cache_dir)))
+
+    def test_put_failed(self):
+        with patch('os.replace', side_effect=PermissionError()):
+            self.sut.put(TestFeedCache.URL, b'<feed/>')
+        self.assertIsNone(self.sut.get(TestFeedCache.URL))
+        self.assertEqual([], os.listdir(self.sut.cache_dir),
+                         'a temporal file should be removed')
+
+    def test_disabled(self):
+        sut = FeedCache(self.dir, 0)
+        sut.put(TestFeedCache.URL, b'<feed/>')
+        self.assertIsNone(sut.get(TestFeedCache.URL))
+        self.assertFalse(os.path.exists(sut.cache_dir))
+
+
+if __name__ == "__main__":
+    unittest.main()
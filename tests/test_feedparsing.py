@@ -0,0 +1,81 @@
+import pickle
+import time
+import unittest
+
+import feedparser
+
+from bluetube.feedparsing import (ENTRY_FIELDS, NotYoutubeFeed,
+                                  iter_youtube_entries, parse_feed)
+from tests.test_bluetube import read_mocked_data
+
+RSS = '''<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0">
+<channel>
+  <title>Podcast</title>
+  <item>
+    <title>Episode 1</title>
+    <link>https://example.com/1</link>
+    <description>The first one</description>
+    <pubDate>Tue, 28 Jul 2020 15:31:18 GMT</pubDate>
+  </item>
+</channel>
+</rss>
+'''
+
+
+class TestFeedParsing(unittest.TestCase):
+
+    def setUp(self):
+        self.data = [d.encode() for d in read_mocked_data()]
+
+    def test_parse_feed(self):
+        '''the YouTube parser gets the same as feedparser'''
+        for d in self.data:
+            full = feedparser.parse(d)
+            compact = parse_feed(d)
+            self.assertEqual(len(full.entries), len(compact.entries))
+            for f, c in zip(full.entries, compact.entries):
+                self.assertEqual(set(ENTRY_FIELDS), set(c.keys()))
+                for k in ENTRY_FIELDS:
+                    exp, act = f[k], c[k]
+                    if isinstance(exp, str):
+                        # feedparser drops carriage returns of &#13;
+                        exp = exp.replace('\r', '')
+                        act = act.replace('\r', '')
+                    self.assertEqual(exp, act, f'unexpected {k}')
+                    self.assertIs(c[k], getattr(c, k))
+
+    def test_parse_feed_last_update(self):
+        entries = list(iter_youtube_entries(self.data[0]))
+        last_update = time.mktime(entries[2].published_parsed)
+        new = parse_feed(self.data[0], last_update, True)
+        self.assertEqual(entries[:2], new.entries)
+        self.assertEqual(3, len(new.published))
+        new = parse_feed(self.data[0], last_update, False)
+        self.assertEqual(entries[:2], new.entries)
+        self.assertEqual(len(entries), len(new.published))
+
+    def test_parse_feed_stops_early(self):
+        '''the rest of the document is not parsed'''
+        entries = list(iter_youtube_entries(self.data[0]))
+        last_update = time.mktime(entries[0].published_parsed)
+        broken = self.data[0][:len(self.data[0]) // 2]
+        self.assertEqual([], parse_feed(broken, last_update, True).entries)
+
+    def test_parse_feed_fallback(self):
+        with self.assertRaises(NotYoutubeFeed):
+            list(iter_youtube_entries(RSS.encode()))
+        entries = parse_feed(RSS.encode()).entries
+        self.assertEqual(1, len(entries))
+        self.assertEqual('Episode 1', entries[0].title)
+        self.assertEqual('The first one', entries[0].summary)
+        self.assertEqual([], parse_feed(RSS.encode(), time.time()).entries)
+
+    def test_parse_feed_picklable(self):
+        compact = parse_feed(self.data[0])
+        restored = pickle.loads(pickle.dumps(compact))
+        self.assertEqual(compact.entries, restored.entries)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,289 @@
+import io
+import json
+import os
+import shelve
+import shutil
+import sqlite3
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+from feedparser import FeedParserDict
+
+from bluetube.feeds import Feeds, SqlExporter
+from bluetube.model import Entity, OutputFormatType
+from tests.fake_db import FAKE_DB
+
+
+class TestFeeds(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        with shelve.open(os.path.join(self.dir, Feeds.SHELVE_DBFILENAME)) \
+                as db:
+            db['feeds'] = json.loads(FAKE_DB)
+        self.statements = []
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def trace(self, kinds=('INSERT', 'UPDATE', 'DELETE')):
+        '''collect statements that change the DB'''
+        connect = sqlite3.connect
+
+        def traced_connect(*args, **kwargs):
+            db = connect(*args, **kwargs)
+            db.set_trace_callback(
+                lambda s: self.statements.append(s)
+                if s.split()[0] in kinds else None)
+            return db
+        return patch('sqlite3.connect', side_effect=traced_connect)
+
+    def test_migration(self):
+        feeds = Feeds(self.dir).get_all_playlists()
+        exp = json.loads(FAKE_DB)
+        self.assertEqual([a['author'] for a in exp],
+                         [a['author'] for a in feeds])
+        pl = feeds[1]['playlists'][1]
+        exp_pl = exp[1]['playlists'][1]
+        self.assertEqual(exp_pl['title'], pl.title)
+        self.assertEqual(exp_pl['url'], pl.url)
+        self.assertEqual(exp_pl['last_update'], pl.last_update)
+        self.assertEqual(exp_pl['profiles'], pl.profiles)
+        self.assertIs(OutputFormatType.audio, pl.output_format)
+
+        # the shelve DB is migrated once
+        Feeds(self.dir).add_playlist('author', 'title', 'url',
+                                     OutputFormatType.video, ['local'])
+        feeds = Feeds(self.dir).get_all_playlists()
+        self.assertEqual(4, sum(len(a['playlists']) for a in feeds))
+
+    def test_migration_failed_entities(self):
+        entry = FeedParserDict(yt_videoid='id', link='link', title='title',
+                               summary='s' * 2 * Entity.MAX_SUMMARY,
+                               published_parsed=time.localtime(1),
+                               media_thumbnail=[{'url': 'url'}])
+        raw = json.loads(FAKE_DB)
+        raw[0]['playlists'][0]['failed_entities'] = {'mobile': [entry]}
+        with shelve.open(os.path.join(self.dir, Feeds.SHELVE_DBFILENAME)) \
+                as db:
+            db['feeds'] = raw
+
+        pl = Feeds(self.dir).get_playlist('ТаТоТаке', 'ТаТоТаке')
+
+        e = pl.failed_entities['mobile'][0]
+        self.assertIsInstance(e, Entity)
+        self.assertEqual(('id', 'link', 'title', 1),
+                         (e.yt_videoid, e.link, e.title, e.published))
+        self.assertEqual(Entity.MAX_SUMMARY, len(e.summary))
+
+    def test_sync_changed_rows(self):
+        sut = Feeds(self.dir)
+        pl = sut.get_playlist('24 Канал', 'Чесна політика')
+        entity = Entity('id', 'link', 'title', 'author', 1.0, 'summary')
+        with self.trace():
+            sut.sync()
+            self.assertEqual([], self.statements, 'nothing is changed')
+            pl.last_update = 1
+            pl.add_failed_entities({'mobile': [entity]})
+            sut.sync()
+        updates = [s for s in self.statements if s.startswith('UPDATE')]
+        self.assertEqual(1, len(updates))
+        self.assertIn('last_update', updates[0])
+        self.assertNotIn('profiles', updates[0], 'only changed fields')
+        self.assertFalse(pl.dirty)
+
+        pl = Feeds(self.dir).get_playlist('24 Канал', 'Чесна політика')
+        self.assertEqual(1, pl.last_update)
+        self.assertEqual({'mobile': [entity]}, pl.failed_entities)
+
+    def test_concurrent_sync(self):
+        a, t = '24 Канал', 'Чесна політика'
+        first, second = Feeds(self.dir), Feeds(self.dir)
+        first.get_playlist(a, t).last_update = 1
+        first.get_playlist('ТаТоТаке', 'ТаТоТаке').last_update = 1
+        second.get_playlist(a, t).profiles = ['local']
+        second.remove_playlist('ТаТоТаке', 'ТаТоТаке')
+        first.sync()
+        self.assertFalse(first.has_playlist('ТаТоТаке', 'ТаТоТаке'),
+                         'removed by another process')
+
+        feeds = Feeds(self.dir)
+        pl = feeds.get_playlist(a, t)
+        self.assertEqual(1, pl.last_update)
+        self.assertEqual(['local'], pl.profiles)
+        self.assertFalse(feeds.has_playlist('ТаТоТаке', 'ТаТоТаке'))
+
+    def test_sync_locks_first(self):
+        sut = Feeds(self.dir)
+        sut.get_playlist('ТаТоТаке', 'ТаТоТаке').last_update = 1
+        with self.trace(('BEGIN', 'SELECT', 'UPDATE', 'COMMIT')):
+            sut.sync()
+        self.assertEqual('BEGIN IMMEDIATE', self.statements[0],
+                         'the playlist should be checked under the lock')
+        self.assertEqual('COMMIT', self.statements[-1])
+
+    def test_lazy_failed_entities(self):
+        sut = Feeds(self.dir)
+        pl = sut.get_playlist('ТаТоТаке', 'ТаТоТаке')
+        pl.add_failed_entities({'mobile': [Entity('1', 'l1', 't1'),
+                                           Entity('2', 'l2', 't2')],
+                                'local': [Entity('1', 'l1', 't1')]})
+        sut.sync()
+
+        sut = Feeds(self.dir)
+        with patch.object(sut, '_load_failed',
+                          wraps=sut._load_failed) as load:
+            pl = sut.get_playlist('ТаТоТаке', 'ТаТоТаке')
+            self.assertEqual(3, pl.failed_count)
+            load.assert_not_called()
+            self.assertEqual(['1', '2'], [e.yt_videoid for e in
+                                          pl.pop_failed_entities('mobile')])
+            load.assert_called_once()
+        self.assertEqual(1, pl.failed_count)
+        del pl.failed_entities
+        sut.sync()
+        self.assertEqual(0, Feeds(self.dir).get_playlist('ТаТоТаке',
+                                                         'ТаТоТаке')
+                         .failed_count)
+
+    def test_query(self):
+        sut = Feeds(self.dir)
+        sut.get_playlist('24 Канал', 'Чесна політика').add_failed_entities(
+            {'mobile': [Entity('1', 'l1', 't1')]})
+        sut.sync()
+
+        def titles(**filters):
+            return [pl['title'] for pl in sut.query(**filters)]
+        self.assertEqual(['ТаТоТаке', 'Право на гідність', 'Чесна політика'],
+                         titles())
+        self.assertEqual(['Право на гідність', 'Чесна політика'],
+                         titles(author='24 Канал'))
+        self.assertEqual(['Чесна політика'], titles(title='Чесна*'))
+        self.assertEqual(['ТаТоТаке'], titles(profile='local'))
+        self.assertEqual(['ТаТоТаке'],
+                         titles(out_format=OutputFormatType.video))
+        self.assertEqual(['Право на гідність'], titles(stale_since=1595000000))
+        self.assertEqual(['Чесна політика'], titles(has_failures=True))
+        self.assertEqual(['Право на гідність'],
+                         titles(author='24 Канал', has_failures=False))
+        pl = next(sut.query(has_failures=True))
+        self.assertEqual(1, pl['failed'])
+        self.assertEqual(['mobile'], pl['profiles'])
+        self.assertEqual('audio', pl['out_format'])
+
+    def test_export(self):
+        sut = Feeds(self.dir)
+        sut.get_playlist('24 Канал', 'Чесна політика').add_failed_entities(
+            {'mobile': [Entity('1', 'l1', "it's", 'a', 1.0, 's')]})
+        sut.sync()
+        path = os.path.join(self.dir, 'export.sqlite3')
+        sql_path = os.path.join(self.dir, 'export.sql')
+
+        with patch.object(SqlExporter, 'BATCH_SIZE', 2):
+            SqlExporter(sut).export_db(path)
+            with open(sql_path, 'w') as f:
+                SqlExporter(sut).export(f)
+
+        db = sqlite3.connect(path)
+        sql_db = sqlite3.connect(':memory:')
+        with open(sql_path) as f:
+            sql_db.executescript(f.read())
+        for d in (db, sql_db):
+            self.assertEqual([('ТаТоТаке',), ('24 Канал',)],
+                             d.execute('SELECT name FROM author '
+                                       'ORDER BY id').fetchall())
+            self.assertEqual(('Чесна політика', 'mp3', '["mobile"]',
+                              '2020-07-17 19:28:43', '24 Канал'),
+                             d.execute('SELECT title, out_format, profiles, '
+                                       'last_update, author.name '
+                                       'FROM playlist JOIN author '
+                                       'ON author.id = author_id '
+                                       'WHERE title GLOB "Ч*"').fetchone())
+            self.assertEqual([("it's", 'Чесна політика')],
+                             d.execute('SELECT failed_entity.title, '
+                                       'playlist.title FROM failed_entity '
+                                       'JOIN playlist '
+                                       'ON playlist.id = playlist_id')
+                             .fetchall())
+            d.close()
+
+    def test_backup_restore(self):
+        sut = Feeds(self.dir)
+        entities = {'mobile': [Entity('1', 'l1', 't1', 'a', 1.0, 's'),
+                               Entity('2', 'l2', 't2')]}
+        sut.get_playlist('24 Канал', 'Чесна політика').add_failed_entities(
+            entities)
+        sut.get_playlist('ТаТоТаке', 'ТаТоТаке').add_publish_times([1, 2])
+        sut.sync()
+        f = io.StringIO()
+
+        self.assertEqual(3, sut.backup(f))
+
+        f.seek(0)
+        other_dir = os.path.join(self.dir, 'other')
+        os.mkdir(other_dir)
+        other = Feeds(other_dir)
+        other.add_playlist('24 Канал', 'Чесна політика', 'old url',
+                           OutputFormatType.video, [])
+        with patch.object(Feeds, 'BATCH_SIZE', 2):
+            self.assertEqual(3, other.restore(f))
+
+        restored = Feeds(other_dir)
+        for a in sut.get_all_playlists():
+            for pl in a['playlists']:
+                r = restored.get_playlist(a['author'], pl.title)
+                self.assertEqual(Feeds._get_row(pl), Feeds._get_row(r))
+                self.assertEqual(pl.failed_entities, r.failed_entities)
+        self.assertEqual(entities, other.get_playlist(
+            '24 Канал', 'Чесна політика').failed_entities)
+
+    def test_restore_same_playlist(self):
+        sut = Feeds(self.dir)
+        sut.get_playlist('ТаТоТаке', 'ТаТоТаке').add_publish_times([1, 2])
+        sut.sync()
+        f = io.StringIO()
+        sut.backup(f)
+        lines = f.getvalue().splitlines()
+        line = next(ln for ln in lines if 'ТаТоТаке' in ln)
+        last = json.loads(line)
+        last['url'] = 'new url'
+        f = io.StringIO('\n'.join([line, json.dumps(last)]))
+
+        self.assertEqual(1, sut.restore(f))
+
+        pl = Feeds(self.dir).get_playlist('ТаТоТаке', 'ТаТоТаке')
+        self.assertEqual('new url', pl.url)
+        self.assertEqual([1, 2], pl.publish_times)
+
+    def test_add_remove_playlist(self):
+        sut = Feeds(self.dir)
+        sut.add_playlist('author', 'title', 'url',
+                         OutputFormatType.video, ['local'])
+        sut.remove_playlist('ТаТоТаке', 'ТаТоТаке')
+
+        feeds = Feeds(self.dir)
+        self.assertTrue(feeds.has_playlist('author', 'title'))
+        self.assertFalse(feeds.has_playlist('ТаТоТаке', 'ТаТоТаке'))
+        self.assertEqual(['24 Канал', 'author'], feeds.get_authors())
+
+    def test_bulk_add_remove(self):
+        sut = Feeds(self.dir)
+        pls = [(f'author{i % 10}', f'title{i}', f'url{i}')
+               for i in range(1000)]
+        sut.add_playlists(pls, OutputFormatType.audio, ['local'])
+        self.assertTrue(sut.has_playlist('author9', 'title999'))
+        self.assertEqual('url5', sut.get_playlist('author5', 'title5').url)
+
+        sut.remove_playlists([(a, t) for a, t, _ in pls if a != 'author0'])
+
+        feeds = Feeds(self.dir)
+        self.assertEqual(['ТаТоТаке', '24 Канал', 'author0'],
+                         feeds.get_authors())
+        self.assertEqual(100, len(feeds.get_all_playlists()[2]['playlists']))
+        self.assertIsNone(feeds.get_playlist('author1', 'title1'))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+import copy
+import pickle
+import time
+import unittest
+
+from feedparser import FeedParserDict
+
+from bluetube.model import Entity, WorkItem
+
+
+class TestEntity(unittest.TestCase):
+
+    def setUp(self):
+        self.entry = FeedParserDict(yt_videoid='id', link='link',
+                                    title='title', author='author',
+                                    summary='summary',
+                                    published_parsed=time.localtime(10))
+
+    def test_from_entry(self):
+        sut = Entity.from_entry(self.entry)
+        self.assertEqual({'yt_videoid': 'id', 'link': 'link',
+                          'title': 'title', 'author': 'author',
+                          'published': 10, 'summary': 'summary'},
+                         sut.to_dict())
+        self.assertEqual(sut, Entity.from_dict(sut.to_dict()))
+
+    def test_immutable(self):
+        sut = Entity.from_entry(self.entry)
+        with self.assertRaises(AttributeError):
+            sut.link = 'file.mp3'
+        self.assertEqual(sut, pickle.loads(pickle.dumps(sut)))
+        self.assertEqual(sut, copy.deepcopy(sut))
+
+
+class TestWorkItem(unittest.TestCase):
+
+    def test_link(self):
+        en = Entity('id', 'link', 'title')
+        items = [WorkItem(en), WorkItem(en)]
+        items[0].link = 'file.mp3'
+        self.assertEqual('link', items[1].link)
+        self.assertEqual('link', en.link)
+        self.assertIs(items[0].entity, items[1].entity)
+
+
+if __name__ == "__main__":
+    unittest.main()
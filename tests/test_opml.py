@@ -0,0 +1,44 @@
+import io
+import unittest
+
+from bluetube.model import Playlist
+from bluetube.opml import read_opml, write_opml
+
+YOUTUBE_OPML = '''<opml version="1.1">
+<body>
+  <outline text="YouTube Subscriptions" title="YouTube Subscriptions">
+    <outline text="Channel 1" title="Channel 1" type="rss"
+xmlUrl="https://www.youtube.com/feeds/videos.xml?channel_id=UC1" />
+    <outline text="Channel 2" title="Channel 2" type="rss"
+xmlUrl="https://www.youtube.com/feeds/videos.xml?channel_id=UC2" />
+    <outline text="Channel 1" title="Channel 1" type="rss"
+xmlUrl="https://www.youtube.com/feeds/videos.xml?channel_id=UC1" />
+  </outline>
+</body>
+</opml>
+'''
+
+
+class TestOpml(unittest.TestCase):
+
+    def test_read_opml(self):
+        urls = read_opml(io.StringIO(YOUTUBE_OPML))
+        self.assertEqual(
+            ['https://www.youtube.com/feeds/videos.xml?channel_id=UC1',
+             'https://www.youtube.com/feeds/videos.xml?channel_id=UC2'],
+            urls)
+
+    def test_write_read_opml(self):
+        feeds = [{'author': 'author1',
+                  'playlists': [Playlist('title1', 'url1'),
+                                Playlist('title2', 'url2')]},
+                 {'author': 'ТаТоТаке',
+                  'playlists': [Playlist('ТаТоТаке', 'url3&x=1')]}]
+        f = io.BytesIO()
+        write_opml(f, feeds)
+        f.seek(0)
+        self.assertEqual(['url1', 'url2', 'url3&x=1'], read_opml(f))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -35,6 +35,12 @@ class TestProfile(unittest.TestCase):
         self.assertTrue(c_op, 'no convert options')
         self.assertTrue('output_format' in c_op, 'a key not found')
 
+    def test_get_download_options(self):
+        self.assertEqual({}, self.sut.get_download_options('mobile'))
+        self.assertEqual(2, self.sut.get_download_options('local')
+                         ['concurrency'])
+        self.assertIsNone(self.sut.get_download_options('unknown'))
+
     def test_no_required_configs(self):
         with patch('os.path.join'):
             no_base = {}
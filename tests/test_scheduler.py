@@ -0,0 +1,64 @@
+import unittest
+
+from bluetube.model import Playlist
+from bluetube.scheduler import Scheduler
+
+DAY = 24 * 60 * 60
+
+
+class TestScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.sut = Scheduler()
+        self.pl = Playlist('title', 'url')
+        self.now = 1600000000.0
+
+    def test_new_playlist(self):
+        self.assertTrue(self.sut.is_due(self.pl, self.now))
+
+    def test_cadence(self):
+        '''a weekly channel is fetched about daily'''
+        self.pl.add_publish_times([self.now - i * 7 * DAY for i in range(5)])
+        self.pl.last_fetch = self.now
+        self.assertAlmostEqual(0.7 * DAY, self.sut.get_poll_interval(self.pl))
+        self.assertFalse(self.sut.is_due(self.pl, self.now + 0.5 * DAY))
+        self.assertTrue(self.sut.is_due(self.pl, self.now + 0.8 * DAY))
+
+    def test_max_poll_interval(self):
+        '''a channel that published long ago is fetched daily'''
+        self.pl.add_publish_times([self.now - i * 365 * DAY
+                                   for i in range(5)])
+        self.assertEqual(Scheduler.MAX_POLL_INTERVAL,
+                         self.sut.get_poll_interval(self.pl))
+
+    def test_not_enough_publish_times(self):
+        self.pl.add_publish_times([self.now - 30 * DAY, self.now])
+        self.pl.last_fetch = self.now
+        self.assertTrue(self.sut.is_due(self.pl, self.now))
+
+    def test_failures(self):
+        self.pl.set_fetch_failed(self.now)
+        self.pl.set_fetch_failed(self.now)
+        delay = 2 * Scheduler.FAILURE_DELAY
+        self.assertFalse(self.sut.is_due(self.pl, self.now + delay - 1))
+        self.assertTrue(self.sut.is_due(self.pl, self.now + delay))
+        self.pl.reset_fetch_failures()
+        self.assertTrue(self.sut.is_due(self.pl, self.now))
+
+    def test_full(self):
+        self.pl.set_fetch_failed(self.now)
+        self.pl.add_publish_times([self.now - i * 30 * DAY for i in range(5)])
+        self.pl.last_fetch = self.now
+        self.assertFalse(self.sut.is_due(self.pl, self.now))
+        self.assertTrue(Scheduler(full=True).is_due(self.pl, self.now))
+
+    def test_add_publish_times(self):
+        times = [float(i) for i in range(Playlist.MAX_PUBLISH_TIMES + 5)]
+        self.pl.add_publish_times(times[:10])
+        self.pl.add_publish_times(times[5:])
+        self.assertEqual(times[-Playlist.MAX_PUBLISH_TIMES:],
+                         self.pl.publish_times)
+
+
+if __name__ == "__main__":
+    unittest.main()
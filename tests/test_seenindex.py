@@ -0,0 +1,41 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from bluetube.model import Entity
+from bluetube.seenindex import SeenIndex
+
+
+class TestSeenIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_add_get(self):
+        en = Entity('id1', 'link1', 'title')
+        with SeenIndex(self.dir) as sut:
+            self.assertIsNone(sut.get(en))
+            sut.add(en, SeenIndex.ACCEPTED, 'url1')
+            sut.add(en, SeenIndex.DOWNLOADED, 'url1')
+        with SeenIndex(self.dir) as sut:
+            outcome, t, url = sut.get(en)
+        self.assertEqual(SeenIndex.DOWNLOADED, outcome)
+        self.assertTrue(t)
+        self.assertEqual('url1', url)
+        self.assertTrue(os.listdir(self.dir))
+
+    def test_is_seen_elsewhere(self):
+        en = Entity(None, 'link1', 'title')
+        with SeenIndex(self.dir) as sut:
+            self.assertFalse(sut.is_seen_elsewhere(en, 'url1'))
+            sut.add(en, SeenIndex.REJECTED, 'url1')
+            self.assertFalse(sut.is_seen_elsewhere(en, 'url1'))
+            self.assertTrue(sut.is_seen_elsewhere(en, 'url2'))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,137 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock
+
+from bluetube.downloadstore import DownloadStore
+from bluetube.model import Entity, OutputFormatType, WorkItem
+from bluetube.ytdldownloader import YoutubeDlDownloader
+
+
+class TestYoutubeDlDownloader(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.executor = MagicMock()
+        self.executor.does_command_exist.return_value = True
+        self.executor.call.side_effect = self.call
+        self.sut = YoutubeDlDownloader(self.executor, MagicMock(), self.dir)
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def call(self, args, cwd=None):
+        '''download files named by the video IDs of the links
+        and print their paths, links with "bad" in them fail'''
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(0.05)
+        i = args.index('--print-to-file') + 2
+        status = 0
+        with open(args[i], 'w') as printed:
+            for link in args[i + 1:]:
+                video_id = link.split('=')[-1]
+                path = os.path.join(cwd, f'{video_id}.webm')
+                open(path + ('.part' if 'bad' in video_id else ''),
+                     'w').close()
+                if 'bad' in video_id:
+                    status = 1
+                else:
+                    printed.write(f'{video_id}\t18\t60\t{path}\n')
+        with self.lock:
+            self.running -= 1
+        return status
+
+    @staticmethod
+    def make_items(*ids):
+        return [WorkItem(Entity(i, f'https://youtu.be/watch?v={i}', i,
+                                'author', 1.0, 'summary'))
+                for i in ids]
+
+    def test_download_concurrently(self):
+        items = self.make_items('aaa', 'bbb', 'bad', 'ccc')
+        s, f = self.sut.download(items, OutputFormatType.video,
+                                 {'output_format': ''}, concurrency=2)
+        self.assertEqual(2, self.max_running)
+        self.assertEqual(['aaa.webm', 'bbb.webm', 'ccc.webm'],
+                         sorted(en.link for en in s))
+        self.assertEqual(['bad'], [en.entity.yt_videoid for en in f])
+        self.assertEqual(['aaa.webm', 'bbb.webm', 'ccc.webm'],
+                         sorted(os.listdir(self.dir)),
+                         'files of failed downloads are removed')
+
+    def test_download_failed_keeps_files(self):
+        finished = ['bad.f18.webm', 'bad.mp3']  # e.g. for other profiles
+        for f in finished + ['bad.f18.webm.part-Frag2', 'bad.webm.ytdl',
+                             'bad.temp.webm']:
+            open(os.path.join(self.dir, f), 'w').close()
+        s, f = self.sut.download(self.make_items('bad'),
+                                 OutputFormatType.video,
+                                 {'output_format': ''})
+        self.assertEqual(1, len(f))
+        self.assertEqual(finished, sorted(os.listdir(self.dir)),
+                         'only partial files should be removed')
+
+    def test_download_once(self):
+        items = self.make_items('a', 'a')
+        s, f = self.sut.download(items, OutputFormatType.video,
+                                 {'output_format': ''}, concurrency=2)
+        self.assertEqual(['a.webm', 'a.webm'], [en.link for en in s])
+        self.assertEqual(1, self.executor.call.call_count)
+        s, _ = self.sut.download(self.make_items('a'), OutputFormatType.video,
+                                 {'output_format': ''})
+        self.assertEqual(['a.webm'], [en.link for en in s])
+        self.assertEqual(1, self.executor.call.call_count, 'cached')
+
+    def test_download_batches(self):
+        items = self.make_items('aaa', 'bad', 'bbb', 'ccc', 'ddd')
+        s, f = self.sut.download(items, OutputFormatType.video,
+                                 {'output_format': ''},
+                                 concurrency=2, batch_size=2)
+        self.assertEqual(3, self.executor.call.call_count)
+        self.assertEqual(['aaa.webm', 'bbb.webm', 'ccc.webm', 'ddd.webm'],
+                         sorted(en.link for en in s))
+        self.assertEqual(['bad'], [en.entity.yt_videoid for en in f],
+                         'a failure is attributed to its video')
+        self.assertNotIn('bad.webm.part', os.listdir(self.dir))
+
+    def test_download_store(self):
+        store = DownloadStore(self.dir, 2 ** 20)
+        self.sut = YoutubeDlDownloader(self.executor, MagicMock(),
+                                       self.dir, store)
+        self.sut.download(self.make_items('aaa'), OutputFormatType.video,
+                          {'output_format': ''})
+        other_dir = os.path.join(self.dir, 'other_run')
+        os.mkdir(other_dir)
+        other = YoutubeDlDownloader(self.executor, MagicMock(),
+                                    other_dir, store)
+        s, _ = other.download(self.make_items('aaa'), OutputFormatType.video,
+                              {'output_format': ''})
+        self.assertEqual(1, self.executor.call.call_count,
+                         'the file is taken from the store')
+        self.assertEqual(['aaa.webm'], [en.link for en in s])
+        self.assertTrue(os.path.exists(os.path.join(other_dir, 'aaa.webm')))
+
+    def test_build_source_options(self):
+        build = self.sut._build_source_options
+        options = build(OutputFormatType.video, [{'output_format': 'mp4'},
+                                                 {'output_format': ''}])
+        self.assertEqual(('--format', 'mp4'), options[-2:],
+                         'one container fits the best quality as well')
+        options = build(OutputFormatType.video, [{'output_format': 'mp4'},
+                                                 {'output_format': 'webm'}])
+        self.assertNotIn('--format', options)
+        options = build(OutputFormatType.audio, [{'output_format': 'mp3'},
+                                                 {'output_format': 'm4a'}])
+        self.assertNotIn('--extract-audio', options)
+
+
+if __name__ == "__main__":
+    unittest.main()
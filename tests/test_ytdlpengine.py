@@ -0,0 +1,103 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+from bluetube.model import Entity, OutputFormatType, WorkItem
+from bluetube.ytdlpengine import YtDlpEngine
+
+
+class FakeDownloadError(Exception):
+    pass
+
+
+class TestYtDlpEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.yt_dlp = MagicMock()
+        self.yt_dlp.utils.YoutubeDLError = FakeDownloadError
+        self.yt_dlp.YoutubeDL.side_effect = self.make_ydl
+        self.yt_dlp.parse_options.side_effect = \
+            lambda args: MagicMock(ydl_opts={'ignoreerrors': True})
+        patch('bluetube.ytdlpengine.yt_dlp', self.yt_dlp).start()
+        self.sut = YtDlpEngine(MagicMock(), MagicMock(), self.dir)
+
+    def tearDown(self):
+        patch.stopall()  # @UndefinedVariable
+        shutil.rmtree(self.dir)
+
+    def make_ydl(self, params):
+        '''make a fake YoutubeDL that downloads files named by video IDs,
+        links with "bad" in them fail'''
+        def extract_info(link, download):
+            video_id = link.split('=')[-1]
+            if 'bad' in video_id:
+                raise FakeDownloadError(video_id)
+            path = os.path.join(params['paths']['home'], f'{video_id}.m4a')
+            open(path, 'w').close()
+            for hook in params['progress_hooks']:
+                hook({'status': 'finished', 'filename': path})
+            return {'id': video_id, 'format_id': '140', 'duration': 60,
+                    'requested_downloads': [{'filepath': path}]}
+        ydl = MagicMock(params=params)
+        ydl.extract_info.side_effect = extract_info
+        return ydl
+
+    @staticmethod
+    def make_items(*ids):
+        return [WorkItem(Entity(i, f'https://youtu.be/watch?v={i}', i,
+                                'author', 1.0, 'summary'))
+                for i in ids]
+
+    def test_download(self):
+        hook = MagicMock()
+        self.sut.add_progress_hook(hook)
+        s, f = self.sut.download(self.make_items('aaa', 'bad', 'bbb'),
+                                 OutputFormatType.audio,
+                                 {'output_format': 'm4a'})
+        self.assertEqual(['aaa.m4a', 'bbb.m4a'], sorted(en.link for en in s))
+        self.assertEqual(['bad'], [en.entity.yt_videoid for en in f])
+        info = s[0].info
+        self.assertEqual(('140', 0, 60.0),
+                         (info.format, info.size, info.duration))
+        self.assertEqual(2, hook.call_count)
+        args = self.yt_dlp.parse_options.call_args[0][0]
+        self.assertIn('--audio-format=m4a', args)
+
+    def test_reuse_downloader(self):
+        self.sut.download(self.make_items('aaa', 'bbb'),
+                          OutputFormatType.video,
+                          {'output_format': ''}, concurrency=2)
+        made = self.yt_dlp.YoutubeDL.call_count
+        self.assertIn(made, (1, 2), 'a downloader per worker at most')
+        self.sut.download(self.make_items('ccc'), OutputFormatType.video,
+                          {'output_format': ''}, concurrency=2)
+        self.assertEqual(made, self.yt_dlp.YoutubeDL.call_count,
+                         'an idle downloader should be reused')
+
+    def test_next_run(self):
+        self.sut.download(self.make_items('aaa'), OutputFormatType.video,
+                          {'output_format': ''})
+        other_dir = os.path.join(self.dir, 'run2')
+        os.mkdir(other_dir)
+        self.sut.set_temp_dir(other_dir)
+        s, _ = self.sut.download(self.make_items('aaa'),
+                                 OutputFormatType.video,
+                                 {'output_format': ''})
+        self.assertEqual(1, self.yt_dlp.YoutubeDL.call_count)
+        self.assertTrue(os.path.exists(os.path.join(other_dir, 'aaa.m4a')),
+                        'downloaded to the directory of the run')
+
+    def test_not_installed(self):
+        with patch('bluetube.ytdlpengine.yt_dlp', None):
+            s, f = self.sut.download(self.make_items('aaa'),
+                                     OutputFormatType.video,
+                                     {'output_format': ''})
+        self.assertEqual([], s)
+        self.assertEqual(1, len(f))
+
+
+if __name__ == "__main__":
+    unittest.main()